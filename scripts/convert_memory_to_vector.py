@@ -1,123 +1,675 @@
 import os
 import json
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
-from dotenv import load_dotenv
-import firebase_admin.auth
-from google.cloud.firestore_v1.vector import Vector
+import time
+import argparse
+import threading
+from queue import Queue
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 
+# Firebase is imported and initialized on first use, so --help and importing this module stay fast
+_db = None
+_init_lock = threading.Lock()
 
-# Load environment variables from .env file
-load_dotenv()
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_SIZE = 500
+DEFAULT_BATCH_SIZE = 400
+DEFAULT_WORKERS = 8
+DEFAULT_PAGE_SIZE = 300
+# User ids listed ahead of the backfill workers, per worker
+QUEUE_DEPTH_PER_WORKER = 4
 
-# Get the path to the service account file from environment variables
-service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT')
+# Reason codes for documents whose embedding cannot be converted
+REASON_MISSING = 'missing_embedding'
+REASON_EMPTY = 'empty_embedding'
+REASON_NOT_A_LIST = 'not_a_list'
+REASON_NOT_NUMERIC = 'not_numeric'
+REASON_DIMENSION = 'dimension_mismatch'
+REASON_NON_FINITE = 'non_finite'
+REASON_ZERO_NORM = 'zero_norm'
 
-# Initialize Firebase Admin with the service account file
-cred = credentials.Certificate(service_account_path)
-firebase_admin.initialize_app(cred)
 
-# Get a Firestore client
-db = firestore.client()
+def get_app():
+    """The Firebase Admin app, initialized once from the FIREBASE_SERVICE_ACCOUNT file"""
+    import firebase_admin
+    from firebase_admin import credentials
+    from dotenv import load_dotenv
 
-def print_all_user_name_and_email():
+    with _init_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+        # Load environment variables from .env file
+        load_dotenv()
+        service_account_path = os.getenv('FIREBASE_SERVICE_ACCOUNT')
+        if not service_account_path:
+            raise RuntimeError("FIREBASE_SERVICE_ACCOUNT must point to a service account JSON file")
+        return firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+
+
+def get_db():
+    """Shared Firestore client, created on the first call"""
+    global _db
+    if _db is None:
+        app = get_app()
+        from firebase_admin import firestore
+        with _init_lock:
+            if _db is None:
+                _db = firestore.client(app)
+    return _db
+
+
+class MigrationCheckpoint:
+    """Append-only progress log that lets an interrupted backfill resume.
+
+    Each line is a JSON event: either the last committed document id for a
+    user ({"user": uid, "cursor": doc_id}) or a finished user
+    ({"user": uid, "done": true}). Replaying the log on load rebuilds the
+    state, and a torn final line from a crash is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cursors = {}
+        self.completed_users = set()
+        self.last_completed_user = None
+        self._lock = threading.Lock()
+        torn = self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if torn:
+            # Terminate a partial line left by a crash so new events parse
+            self._file.write("\n")
+
+    def _load(self):
+        """Replay the log; returns True if it ends in a partial line"""
+        if not os.path.exists(self.path):
+            return False
+        line = ""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                user_id = event.get("user")
+                if event.get("done"):
+                    self.completed_users.add(user_id)
+                    self.last_completed_user = user_id
+                    self.cursors.pop(user_id, None)
+                elif "cursor" in event:
+                    self.cursors[user_id] = event["cursor"]
+        return bool(line) and not line.endswith("\n")
+
+    def _append(self, event):
+        self._file.write(json.dumps(event) + "\n")
+        self._file.flush()
+
+    def is_complete(self, user_id):
+        return user_id in self.completed_users
+
+    def cursor_for(self, user_id):
+        return self.cursors.get(user_id)
+
+    def record_cursor(self, user_id, doc_id):
+        with self._lock:
+            self.cursors[user_id] = doc_id
+            self._append({"user": user_id, "cursor": doc_id})
+
+    def mark_complete(self, user_id):
+        with self._lock:
+            self.completed_users.add(user_id)
+            self.last_completed_user = user_id
+            self.cursors.pop(user_id, None)
+            self._append({"user": user_id, "done": True})
+
+    def close(self):
+        self._file.close()
+
+
+class QuarantineLog:
+    """Thread-safe JSONL record of documents the backfill refused to convert"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def record(self, user_id, doc_id, reason):
+        with self._lock:
+            self.counts[reason] += 1
+            if self._file:
+                self._file.write(json.dumps({"user": user_id, "doc": doc_id, "reason": reason}) + "\n")
+                self._file.flush()
+        print(f"Quarantined document {doc_id} for user {user_id} - {reason}")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def _numeric_array(values, ndim):
+    """np.array(values) if it is a numeric array of the given rank, else None"""
+    # NumPy would silently turn bools into 1 and 0
+    items = values if ndim == 1 else (value for row in values for value in row)
+    if any(isinstance(value, bool) for value in items):
+        return None
     try:
-        # Get all users from Firebase Authentication
-        users = firebase_admin.auth.list_users()
-        
-        # mailing list csv ensure utf-8 encoding
-        with open('mailing_list.csv', 'w', encoding='utf-8') as f:
-            f.write("Name,Email\n")
-            for user in users.users:
-                f.write(f"{user.display_name},{user.email}\n")
+        array = np.array(values)
+    except (ValueError, TypeError):
+        return None
+    if array.ndim != ndim or array.dtype.kind not in 'iuf':
+        return None
+    return array
+
+
+def convert_embedding_page(docs, dimension=None, normalize=False, float32=False):
+    """Validate a page of embeddings as a single NumPy array and build Vectors.
+
+    dimension defaults to the most common length on the page. Rows are
+    checked together for dtype and NaN/inf, then optionally L2-normalized
+    and rounded to float32 precision.
+    Returns (converted, quarantined): lists of (doc_id, Vector) and
+    (doc_id, reason code).
+    """
+    from google.cloud.firestore_v1.vector import Vector
+
+    quarantined = []
+    doc_ids = []
+    rows = []
+    for doc in docs:
+        embedding = (doc.to_dict() or {}).get("embedding")
+        if embedding is None:
+            quarantined.append((doc.id, REASON_MISSING))
+        elif not isinstance(embedding, (list, tuple)):
+            quarantined.append((doc.id, REASON_NOT_A_LIST))
+        elif not embedding:
+            quarantined.append((doc.id, REASON_EMPTY))
+        else:
+            doc_ids.append(doc.id)
+            rows.append(embedding)
+    if not rows:
+        return [], quarantined
+
+    if dimension is None:
+        dimension = Counter(len(row) for row in rows).most_common(1)[0][0]
+    keep = []
+    for i, row in enumerate(rows):
+        if len(row) == dimension:
+            keep.append(i)
+        else:
+            quarantined.append((doc_ids[i], REASON_DIMENSION))
+    doc_ids = [doc_ids[i] for i in keep]
+    rows = [rows[i] for i in keep]
+    if not rows:
+        return [], quarantined
+
+    # Strings, None, bools or nesting make the whole page non-numeric; find the culprits
+    matrix = _numeric_array(rows, ndim=2)
+    if matrix is None:
+        numeric = [_numeric_array(row, ndim=1) is not None for row in rows]
+        quarantined.extend((doc_id, REASON_NOT_NUMERIC) for doc_id, ok in zip(doc_ids, numeric) if not ok)
+        doc_ids = [doc_id for doc_id, ok in zip(doc_ids, numeric) if ok]
+        matrix = np.array([row for row, ok in zip(rows, numeric) if ok], dtype=np.float64).reshape(-1, dimension)
+    else:
+        matrix = matrix.astype(np.float64, copy=False)
 
+    finite = np.isfinite(matrix).all(axis=1)
+    valid = finite.copy()
+    with np.errstate(over='ignore'):
+        if normalize:
+            norms = np.linalg.norm(np.where(finite[:, None], matrix, 0.0), axis=1)
+            zero = finite & (norms == 0)
+            quarantined.extend((doc_id, REASON_ZERO_NORM) for doc_id, bad in zip(doc_ids, zero) if bad)
+            # A norm that overflows can't be normalized meaningfully
+            finite &= np.isfinite(norms)
+            valid &= finite & ~zero
+            matrix[valid] /= norms[valid, None]
+        if float32:
+            # Values beyond the float32 range overflow to inf here
+            matrix = matrix.astype(np.float32)
+            finite &= np.isfinite(matrix).all(axis=1)
+    quarantined.extend((doc_id, REASON_NON_FINITE) for doc_id, ok in zip(doc_ids, finite) if not ok)
+    valid &= finite
+
+    converted = [(doc_id, Vector(row.tolist())) for doc_id, ok, row in zip(doc_ids, valid, matrix) if ok]
+    return converted, quarantined
+
+
+def iter_users():
+    """Lazily yield every Firebase Authentication user, fetching the next page of up to 1000 only when needed"""
+    from firebase_admin import auth
+
+    return auth.list_users(app=get_app()).iterate_all()
+
+
+def iter_user_ids():
+    """Lazily yield every user's uid"""
+    for user in iter_users():
+        yield user.uid
+
+
+def print_all_user_name_and_email(prefix='mailing_list'):
+    """Write every user's name and email to PREFIX.csv and PREFIX.txt"""
+    try:
+        # mailing list csv ensure utf-8 encoding, written in one pass over all pages of users
         # also make a single .txt with To add contacts manually, just provide a valid email address (e.g john.doe@example.com or "John Doe" <jd@example.com>) syntax
-        with open('mailing_list.txt', 'w', encoding='utf-8') as f:
-            for user in users.users:
-                f.write(f"{user.display_name} <{user.email}>\n")
+        with open(f'{prefix}.csv', 'w', encoding='utf-8') as csv_file, \
+                open(f'{prefix}.txt', 'w', encoding='utf-8') as txt_file:
+            csv_file.write("Name,Email\n")
+            for user in iter_users():
+                csv_file.write(f"{user.display_name},{user.email}\n")
+                txt_file.write(f"{user.display_name} <{user.email}>\n")
 
     except Exception as e:
         print(f"Error getting users: {e}")
 
-def get_user_conversations(user_id):
+def conversations_collection(user_id):
+    """Reference to a user's memory/{uid}/conversations collection"""
+    return get_db().collection('memory').document(user_id).collection('conversations')
+
+
+def iter_conversation_pages(user_id, page_size=DEFAULT_PAGE_SIZE, fields=None,
+                            missing_vector_only=False, start_after=None):
+    """Lazily yield (cursor, docs) pages of a user's conversations in document id order.
+
+    fields is a field mask applied server-side (None reads whole documents).
+    cursor is the id of the last document scanned for the page, suitable for
+    resuming with start_after, and is returned even when every document on
+    the page was filtered out.
+
+    Firestore cannot query for a missing field, so missing_vector_only lists
+    the ids that already have embedding_vector with a server-side `!= null`
+    filter and a name-only mask, then drops them from each masked page on
+    the client. That bills each unconverted document once and each
+    converted one twice, and transfers the masked fields of converted
+    documents for nothing, but keeps one round trip per page. On a first
+    backfill nothing is converted yet and the pages are used as read.
+    """
+    from firebase_admin import firestore
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    conversations_ref = conversations_collection(user_id)
+    doc_id = firestore.FieldPath.document_id()
+
+    converted = set()
+    if missing_vector_only:
+        converted_query = conversations_ref\
+            .where(filter=FieldFilter('embedding_vector', '!=', None))\
+            .select([doc_id])
+        converted = {doc.id for doc in converted_query.stream()}
+
+    query = conversations_ref.order_by(doc_id).limit(page_size)
+    if fields is not None:
+        query = query.select(fields)
+
+    cursor = start_after
+    while True:
+        page_query = query
+        if cursor:
+            page_query = query.start_after({doc_id: conversations_ref.document(cursor)})
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        cursor = docs[-1].id
+        scanned = len(docs)
+
+        if converted:
+            docs = [doc for doc in docs if doc.id not in converted]
+
+        yield cursor, docs
+        if scanned < page_size:
+            return
+
+
+def get_user_conversations(user_id, fields=None, page_size=DEFAULT_PAGE_SIZE):
     try:
-        # Create reference to the nested collection
-        conversations_ref = db.collection('memory').document(user_id).collection('conversations')
-        
-        # Get all documents in the conversations collection
-        docs = conversations_ref.stream()
-        
-        # Print each conversation document
+        # Print each conversation document, one page at a time
         conversation_count = 0
-        for doc in docs:
-            conversation_count += 1
-            print(f"Conversation ID: {doc.id}")
-            print("Data:", doc.to_dict())
-            print("-" * 50)
+        for _, docs in iter_conversation_pages(user_id, page_size=page_size, fields=fields):
+            for doc in docs:
+                conversation_count += 1
+                print(f"Conversation ID: {doc.id}")
+                print("Data:", doc.to_dict())
+                print("-" * 50)
         
         print(f"\nTotal conversations found for user {user_id}: {conversation_count}")
             
     except Exception as e:
         print(f"Error getting conversations: {e}")
 
-def update_user_conversations(user_id):
+class VectorBatchWriter:
+    """Converts pages of conversations and writes their embedding_vector in batched partial updates.
+
+    Shared by the per-user and partitioned backfills. document(doc_id)
+    gives the reference to update and owner(doc_id) the (user_id, doc_id)
+    to quarantine under. Each write sets only embedding_vector, and also
+    deletes the raw embedding list when drop_legacy_embedding is set.
+    on_commit(last_doc_id) runs after every commit with the last document
+    that is written or skipped.
+    """
+
+    def __init__(self, label, document, owner, batch_size=DEFAULT_BATCH_SIZE, drop_legacy_embedding=False,
+                 dimension=None, normalize=False, float32=False, quarantine=None, on_commit=None):
+        from firebase_admin import firestore
+
+        self.label = label
+        self.document = document
+        self.owner = owner
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.dimension = dimension
+        self.normalize = normalize
+        self.float32 = float32
+        self.quarantine = quarantine or QuarantineLog()
+        self.on_commit = on_commit
+        self.delete_field = firestore.DELETE_FIELD if drop_legacy_embedding else None
+        self.db = get_db()
+        self.batch = self.db.batch()
+        self.pending = 0
+        self.written = 0
+        self.last_doc_id = None
+
+    def write_page(self, docs, cursor=None):
+        """Validate a page, quarantine its rejects and queue its updates; cursor is the page's last scanned id"""
+        converted, quarantined = convert_embedding_page(docs, dimension=self.dimension,
+                                                        normalize=self.normalize, float32=self.float32)
+        for doc_id, reason in quarantined:
+            self.quarantine.record(*self.owner(doc_id), reason)
+
+        for doc_id, vector in converted:
+            self.last_doc_id = doc_id
+
+            # Write only the new field instead of re-sending the whole document
+            update = {"embedding_vector": vector}
+            if self.delete_field:
+                update["embedding"] = self.delete_field
+            self.batch.update(self.document(doc_id), update)
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.commit()
+
+        if cursor:
+            # Everything up to the page cursor is queued or skipped
+            self.last_doc_id = cursor
+
+    def commit(self):
+        if self.pending:
+            self.batch.commit()
+            self.written += self.pending
+            print(f"Committed {self.pending} documents for {self.label}")
+            self.batch = self.db.batch()
+            self.pending = 0
+        if self.on_commit and self.last_doc_id:
+            self.on_commit(self.last_doc_id)
+
+
+def update_user_conversations(user_id, batch_size=DEFAULT_BATCH_SIZE, checkpoint=None,
+                              page_size=DEFAULT_PAGE_SIZE, **options):
+    """Add embedding_vector to a user's conversations, committing writes in batches.
+
+    Only documents without embedding_vector are read, and only their
+    embedding field. Pages are written by a VectorBatchWriter, which gets
+    options. With a checkpoint, the scan resumes after the user's saved
+    cursor, and the cursor advances after every commit.
+    Returns the number of documents written.
+    """
+    print(f"Updating conversations for user {user_id}")
+    writer = None
     try:
         # Create reference to the nested collection
-        conversations_ref = db.collection('memory').document(user_id).collection('conversations')
-        
-        # Get all documents in the conversations collection
-        docs = conversations_ref.stream()
+        conversations_ref = conversations_collection(user_id)
         
+        cursor = checkpoint.cursor_for(user_id) if checkpoint else None
+        if cursor:
+            print(f"Resuming user {user_id} after document {cursor}")
+        pages = iter_conversation_pages(user_id, page_size=page_size, fields=['embedding'],
+                                        missing_vector_only=True, start_after=cursor)
+
+        writer = VectorBatchWriter(
+            f"user {user_id}", conversations_ref.document, lambda doc_id: (user_id, doc_id),
+            batch_size=batch_size, **options,
+            on_commit=(lambda doc_id: checkpoint.record_cursor(user_id, doc_id)) if checkpoint else None)
+
         # Update each conversation document
-        for doc in docs:
-            doc_data = doc.to_dict()
-            
-            # Skip if embedding_vector already exists
-            if "embedding_vector" in doc_data:
-                print(f"Skipping document {doc.id} - embedding_vector already exists")
-                continue
-                
-            # Check if the document has an "embedding" field
-            if "embedding" in doc_data:
-                try:
-                    # Skip if embedding is empty/zero length
-                    if not doc_data["embedding"]:
-                        print(f"Skipping document {doc.id} - Empty embedding")
-                        continue
-                        
-                    # Convert the "embedding" field to a Vector object
-                    doc_data["embedding_vector"] = Vector(doc_data["embedding"])
-                    
-                    # Create a new document with the corrected Vector type
-                    conversations_ref.document(doc.id).set(doc_data)
-                    print(f"Updated document {doc.id} for user {user_id}")
-                except (ValueError, TypeError) as e:
-                    # Skip documents that can't be converted to Vector
-                    print(f"Skipping document {doc.id} - Error converting to Vector: {e}")
-                    continue
-            else:
-                print(f"No embedding found for document {doc.id} for user {user_id}")
+        for page_cursor, docs in pages:
+            writer.write_page(docs, page_cursor)
+
+        writer.commit()
+        if checkpoint:
+            checkpoint.mark_complete(user_id)
         
-        print(f"Finished updating conversations for user {user_id}")
+        print(f"Finished updating conversations for user {user_id} ({writer.written} updated)")
         
     except Exception as e:
-        print(f"Error updating conversations: {e}")
+        print(f"Error updating conversations for user {user_id}: {e}")
+
+    return writer.written if writer else 0
+
+
+def backfill_conversations(user_ids, workers=DEFAULT_WORKERS, checkpoint=None, **options):
+    """Run update_user_conversations for many users on a bounded pool of worker threads.
+
+    user_ids may be a lazy iterator such as iter_user_ids(). It is read on
+    the calling thread into a bounded queue that the workers consume, so
+    they start on the first users while later pages are still being
+    listed. options are passed through to update_user_conversations.
+    """
+    workers = max(1, workers)
+    user_queue = Queue(maxsize=workers * QUEUE_DEPTH_PER_WORKER)
+
+    def worker():
+        written = 0
+        users = 0
+        while (user_id := user_queue.get()) is not None:
+            written += update_user_conversations(user_id, checkpoint=checkpoint, **options)
+            users += 1
+        return written, users
+
+    start = time.perf_counter()
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker) for _ in range(workers)]
+        try:
+            for user_id in user_ids:
+                if checkpoint and checkpoint.is_complete(user_id):
+                    skipped += 1
+                    continue
+                user_queue.put(user_id)
+        finally:
+            # Let the workers drain the queue and stop, even if listing users failed
+            for _ in futures:
+                user_queue.put(None)
+        results = [future.result() for future in futures]
+
+    if skipped:
+        print(f"Skipped {skipped} users already completed in {checkpoint.path}")
+    total = sum(written for written, _ in results)
+    users = sum(count for _, count in results)
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Backfilled {total} documents across {users} users in {elapsed:.1f}s ({rate:.1f} docs/s)")
+    return total
+
+
+class _PathDoc:
+    """A conversation snapshot identified by its full path, so one page may mix users' documents"""
+
+    def __init__(self, snapshot):
+        self.id = snapshot.reference.path
+        self._data = snapshot.to_dict() or {}
+
+    def to_dict(self):
+        return self._data
+
+
+def _conversation_owner(path):
+    """(user_id, doc_id) for a memory/{uid}/conversations/{doc} path, or None for other conversations"""
+    parts = path.split('/')
+    if len(parts) != 4 or parts[0] != 'memory':
+        return None
+    return parts[1], parts[3]
+
+
+def iter_partition_pages(partition_query, page_size=DEFAULT_PAGE_SIZE, fields=None):
+    """Lazily yield pages of one collection group partition in document path order.
+
+    The page cursor replaces the partition's start cursor and keeps its end
+    cursor, so pages never cross into the next partition.
+    """
+    query = partition_query.limit(page_size)
+    if fields is not None:
+        query = query.select(fields)
+
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc else query
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        last_doc = docs[-1]
+        yield docs
+        if len(docs) < page_size:
+            return
+
+
+def update_partition(partition_query, name, page_size=DEFAULT_PAGE_SIZE, **options):
+    """Add embedding_vector to the conversations in one partition of the collection group scan.
+
+    Works like update_user_conversations, except that a page may hold
+    documents of many users. A partition cannot be filtered server-side on
+    a missing field, so each page reads embedding_vector along with
+    embedding and skips the documents that already have it.
+    Returns the number of documents written.
+    """
+    print(f"Updating conversations in partition {name}")
+    writer = None
+    try:
+        db = get_db()
+        writer = VectorBatchWriter(f"partition {name}", db.document, _conversation_owner, **options)
+        for snapshots in iter_partition_pages(partition_query, page_size=page_size,
+                                              fields=['embedding', 'embedding_vector']):
+            docs = [doc for doc in map(_PathDoc, snapshots)
+                    if _conversation_owner(doc.id) and "embedding_vector" not in doc.to_dict()]
+            writer.write_page(docs)
+
+        writer.commit()
+        print(f"Finished partition {name} ({writer.written} updated)")
+
+    except Exception as e:
+        print(f"Error updating conversations in partition {name}: {e}")
+
+    return writer.written if writer else 0
+
+
+def backfill_partitioned(partitions, workers=DEFAULT_WORKERS, **options):
+    """Backfill every user's conversations through a `conversations` collection group query.
+
+    The query is split into up to partitions ranges of about equal document
+    count, each processed by update_partition on a pool of worker threads,
+    so users with huge histories are spread over many workers instead of
+    holding up one. options are passed through to update_partition.
+    """
+    group = get_db().collection_group('conversations')
+    partition_queries = [partition.query() for partition in group.get_partitions(max(1, partitions))]
+    print(f"Scanning conversations in {len(partition_queries)} partitions")
+
+    start = time.perf_counter()
+    total = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(update_partition, query, f"{index}/{len(partition_queries)}", **options)
+            for index, query in enumerate(partition_queries, 1)
+        ]
+        for future in as_completed(futures):
+            total += future.result()
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Backfilled {total} documents across {len(futures)} partitions in {elapsed:.1f}s ({rate:.1f} docs/s)")
+    return total
 
 
 def get_all_user_ids():
-    users = firebase_admin.auth.list_users()
-    return [user.uid for user in users.users]
+    return list(iter_user_ids())
 
-if __name__ == "__main__":
-    user_ids = get_all_user_ids()
-    for user_id in user_ids:
-        print(f"Updating conversations for user {user_id}")
-        update_user_conversations(user_id)
 
-    # Replace with actual user ID
-    # user_id = "zKvN3U5t0MSrWrmFG6ngiUQq2gP2"
-    # get_user_conversations(user_id)
-    # update_user_conversations(user_id)
+def backfill(checkpoint_path=None, quarantine_path=None, workers=DEFAULT_WORKERS, partitions=None, **options):
+    """Backfill embedding_vector for every user, optionally resuming from a checkpoint file.
+
+    With partitions, conversations are scanned by collection group
+    partition instead of user by user; that scan has no checkpoint, and
+    a rerun skips the documents already converted. options are passed
+    through to update_user_conversations or update_partition.
+    """
+    if partitions and checkpoint_path:
+        raise ValueError("A partitioned backfill cannot use a checkpoint")
+    checkpoint = MigrationCheckpoint(checkpoint_path) if checkpoint_path else None
+    quarantine = QuarantineLog(quarantine_path)
+    try:
+        if partitions:
+            total = backfill_partitioned(partitions, workers=workers, quarantine=quarantine, **options)
+        else:
+            total = backfill_conversations(iter_user_ids(), workers=workers, checkpoint=checkpoint,
+                                           quarantine=quarantine, **options)
+        if quarantine.counts:
+            print(f"Quarantined documents by reason: {dict(quarantine.counts)}")
+        return total
+    finally:
+        quarantine.close()
+        if checkpoint:
+            checkpoint.close()
+
 
-    # print_all_user_name_and_email()
\ No newline at end of file
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the embeddings on users' memory conversations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = subparsers.add_parser('backfill', help="add embedding_vector to every user's conversations")
+    backfill_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                                 help=f"writes per Firestore batch commit (max {MAX_BATCH_SIZE})")
+    backfill_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                                 help="number of users (or partitions) processed concurrently")
+    backfill_parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                                 help="documents read per Firestore query page")
+    backfill_parser.add_argument('--drop-legacy-embedding', action='store_true',
+                                 help="delete the raw embedding list in the same write")
+    backfill_parser.add_argument('--dimension', type=int,
+                                 help="required embedding length (default: most common length per page)")
+    backfill_parser.add_argument('--normalize', action='store_true',
+                                 help="L2-normalize embeddings before writing")
+    backfill_parser.add_argument('--float32', action='store_true',
+                                 help="round embeddings to float32 precision")
+    backfill_parser.add_argument('--quarantine', metavar='PATH',
+                                 help="JSONL file recording documents that failed validation")
+    backfill_parser.add_argument('--checkpoint', metavar='PATH',
+                                 help="progress log used to resume an interrupted run")
+    backfill_parser.add_argument('--partitions', type=int,
+                                 help="scan all conversations as a collection group split into this many "
+                                      "partitions instead of user by user (no --checkpoint)")
+
+    inspect_parser = subparsers.add_parser('inspect', help="print a user's conversation documents")
+    inspect_parser.add_argument('user_id')
+    inspect_parser.add_argument('--fields', nargs='+', help="only read these fields")
+    inspect_parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+
+    export_parser = subparsers.add_parser('export-users', help="write every user's name and email")
+    export_parser.add_argument('--prefix', default='mailing_list', help="output path without .csv/.txt")
+    args = parser.parse_args(argv)
+    if args.command == 'backfill' and args.partitions and args.checkpoint:
+        parser.error("--checkpoint only applies to the per-user backfill, not --partitions")
+
+    if args.command == 'backfill':
+        backfill(checkpoint_path=args.checkpoint, quarantine_path=args.quarantine, workers=args.workers,
+                 partitions=args.partitions, batch_size=args.batch_size, page_size=args.page_size,
+                 drop_legacy_embedding=args.drop_legacy_embedding, dimension=args.dimension,
+                 normalize=args.normalize, float32=args.float32)
+    elif args.command == 'inspect':
+        get_user_conversations(args.user_id, fields=args.fields, page_size=args.page_size)
+    else:
+        print_all_user_name_and_email(args.prefix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from convert_memory_to_vector import iter_conversation_pages
+
+
+DEFAULT_BLOCK_SIZE = 65536
+DEFAULT_TOP_K = 10
+
+
+def export_user_embeddings(user_id, prefix, page_size=500):
+    """Export a user's embedding_vector fields to PREFIX.f32 plus a PREFIX.json id index.
+
+    PREFIX.f32 is a raw little-endian float32 matrix with one row per
+    conversation, written page by page so the export never holds the whole
+    history in memory. Returns the number of rows written.
+    """
+    ids = []
+    dim = None
+    skipped = 0
+    with open(f"{prefix}.f32", 'wb') as f:
+        for _, docs in iter_conversation_pages(user_id, page_size=page_size, fields=['embedding_vector']):
+            rows = []
+            for doc in docs:
+                vector = (doc.to_dict() or {}).get("embedding_vector")
+                if vector is None or (dim is not None and len(vector) != dim):
+                    skipped += 1
+                    continue
+                dim = dim or len(vector)
+                ids.append(doc.id)
+                rows.append(list(vector))
+            if rows:
+                np.asarray(rows, dtype='<f4').tofile(f)
+
+    with open(f"{prefix}.json", 'w', encoding='utf-8') as f:
+        json.dump({"user": user_id, "dim": dim or 0, "count": len(ids), "ids": ids}, f)
+
+    print(f"Exported {len(ids)} embeddings for user {user_id} to {prefix}.f32 ({skipped} skipped)")
+    return len(ids)
+
+
+def load_embeddings(prefix):
+    """Memory-map an export; returns (ids, float32 matrix of shape (count, dim))"""
+    with open(f"{prefix}.json", 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if not index["count"]:
+        return index["ids"], np.zeros((0, index["dim"]), dtype=np.float32)
+    matrix = np.memmap(f"{prefix}.f32", dtype='<f4', mode='r', shape=(index["count"], index["dim"]))
+    return index["ids"], matrix
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _merge_top_k(best_scores, best_rows, scores, rows, k):
+    """Fold a block of candidate scores into the running per-query top-k"""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    rows = np.concatenate([best_rows, rows], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+
+def _sort_top_k(scores, rows):
+    order = np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+def exact_top_k(matrix, queries, k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE):
+    """Exact top-k cosine search of queries against matrix.
+
+    The matrix is scanned in row blocks with one matrix multiply per block,
+    so a memory-mapped export is never fully loaded.
+    Returns (scores, rows), each of shape (len(queries), k), best first.
+    """
+    queries = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+    k = min(k, len(matrix))
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(matrix), block_size):
+        block = _normalize_rows(np.asarray(matrix[start:start + block_size], dtype=np.float32))
+        scores = queries @ block.T
+        rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+        best_scores, best_rows = _merge_top_k(best_scores, best_rows, scores, rows, k)
+    return _sort_top_k(best_scores, best_rows)
+
+
+class IVFIndex:
+    """Approximate cosine index: a k-means coarse quantizer over inverted lists.
+
+    A search only scores the rows in the nprobe lists whose centroids are
+    closest to the query.
+    """
+
+    def __init__(self, n_lists=64, iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.lists = []
+        self.vectors = None
+
+    def train(self, matrix, sample_size=50000):
+        vectors = _normalize_rows(np.asarray(matrix, dtype=np.float32))
+        rng = np.random.default_rng(self.seed)
+        n_lists = max(1, min(self.n_lists, len(vectors)))
+
+        sample = vectors
+        if len(vectors) > sample_size:
+            sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(self.iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for list_id in range(n_lists):
+                members = sample[assignment == list_id]
+                if len(members):
+                    centroids[list_id] = members.mean(axis=0)
+            centroids = _normalize_rows(centroids)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == list_id) for list_id in range(n_lists)]
+        self.vectors = vectors
+        return self
+
+    def search(self, queries, k=DEFAULT_TOP_K, nprobe=8):
+        """Returns (scores, rows) like exact_top_k; rows are -1 where fewer than k were probed"""
+        queries = _normalize_rows(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        nprobe = min(nprobe, len(self.lists))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[list_id] for list_id in probes[i]])
+            if not len(candidates):
+                continue
+            candidate_scores = self.vectors[candidates] @ query
+            top = min(k, len(candidates))
+            keep = np.argpartition(-candidate_scores, top - 1)[:top]
+            scores[i, :top] = candidate_scores[keep]
+            rows[i, :top] = candidates[keep]
+        return _sort_top_k(scores, rows)
+
+
+def recall_at_k(approx_rows, exact_rows):
+    """Mean fraction of the exact top-k that the approximate search returned"""
+    hits = [len(set(a) & set(e)) / len(e) for a, e in zip(approx_rows.tolist(), exact_rows.tolist())]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def benchmark(prefix, n_queries=100, k=DEFAULT_TOP_K, n_lists=64, nprobe=8, seed=0):
+    """Time exact and IVF search using stored embeddings as queries and report recall"""
+    ids, matrix = load_embeddings(prefix)
+    if not len(ids):
+        print(f"No embeddings in {prefix}")
+        return
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(matrix[rng.choice(len(ids), min(n_queries, len(ids)), replace=False)])
+
+    start = time.perf_counter()
+    _, exact_rows = exact_top_k(matrix, queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    index = IVFIndex(n_lists=n_lists, seed=seed).train(matrix)
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, ivf_rows = index.search(queries, k, nprobe=nprobe)
+    ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print(f"{len(ids)} vectors x {matrix.shape[1]} dims, {len(queries)} queries, k={k}")
+    print(f"exact: {exact_ms:.3f} ms/query")
+    print(f"ivf:   {ivf_ms:.3f} ms/query (nlist={len(index.lists)}, nprobe={nprobe}, "
+          f"build {build_s:.2f}s), recall@{k}={recall_at_k(ivf_rows, exact_rows):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline similarity search over exported conversation embeddings")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="export a user's embedding_vector fields")
+    export_parser.add_argument('user_id')
+    export_parser.add_argument('prefix', help="output path without extension")
+
+    search_parser = subparsers.add_parser('search', help="exact top-k neighbours of a stored conversation")
+    search_parser.add_argument('prefix')
+    search_parser.add_argument('doc_id')
+    search_parser.add_argument('-k', type=int, default=DEFAULT_TOP_K)
+
+    bench_parser = subparsers.add_parser('benchmark', help="compare exact and IVF latency and recall")
+    bench_parser.add_argument('prefix')
+    bench_parser.add_argument('--queries', type=int, default=100)
+    bench_parser.add_argument('-k', type=int, default=DEFAULT_TOP_K)
+    bench_parser.add_argument('--nlist', type=int, default=64)
+    bench_parser.add_argument('--nprobe', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        os.makedirs(os.path.dirname(os.path.abspath(args.prefix)), exist_ok=True)
+        export_user_embeddings(args.user_id, args.prefix)
+    elif args.command == 'search':
+        ids, matrix = load_embeddings(args.prefix)
+        scores, rows = exact_top_k(matrix, matrix[ids.index(args.doc_id)], args.k)
+        for score, row in zip(scores[0], rows[0]):
+            print(f"{score:.4f}  {ids[row]}")
+    else:
+        benchmark(args.prefix, n_queries=args.queries, k=args.k, n_lists=args.nlist, nprobe=args.nprobe)
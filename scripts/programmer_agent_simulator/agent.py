@@ -1,151 +1,546 @@
 import os
 import json
+import time
 import datetime
-import requests
-from typing import List, Dict
+from typing import List, Dict, Union
 from dotenv import load_dotenv
 import asyncio
-import time  # Import time for sleep
+from contextlib import aclosing
 
 load_dotenv(override=True)
 
+OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+
+from code_blocks import FencedCodeStream, extract_code_block, stitch_continuation
+from context_builder import build_context
+from llm_client import LLMClient, Completion, describe_error
+from patch_applier import parse_edits, apply_edits
+from rate_limiter import RateLimitScheduler
+from response_cache import ResponseCache
+from routing import StageRoute, parse_routes
+from snippet_applier import apply_snippets
+from task_plan import Task, TaskPlan, parse_task_plan, task_waves, task_scoped_writeup, merge_snippets, \
+    render_task_writeup
+from tracing import PipelineTracer
+from validation import Validation, validate_snippets, validate_script
 from templates import (
     programmer_agent_planner,
+    programmer_agent_structured_planner,
     programmer_agent_task_coder,
     programmer_agent_task_applier,
+    programmer_agent_patch_applier,
     programmer_agent_continuer,
-    html_system_template
+    html_system_template,
+    Prompt
 )
 
+# How much of a truncated script's end the continuer is shown
+CONTINUATION_TAIL_CHARS = 4000
+
+# Script context each coder call gets when a plan is coded task by task
+TASK_CONTEXT_TOKEN_BUDGET = 6000
+
+
+def _add_usage(total: dict, usage: dict):
+    """Add one response's usage into a running total, including nested counts such as prompt_tokens_details"""
+    for name, count in usage.items():
+        if isinstance(count, dict):
+            _add_usage(total.setdefault(name, {}), count)
+        elif isinstance(count, int):
+            total[name] = total.get(name, 0) + count
+
 class ProgrammerAgentSimulator:
-    def __init__(self, api_key: str = None):
+    def __init__(self,
+                 api_key: str = None,  # default $OPENAI_API_KEY; not needed off OpenAI or with a replay-only cache
+                 max_concurrency: int = 8,
+                 cache: ResponseCache = None,
+                 scheduler: RateLimitScheduler = None,  # share one between simulators to share a rate limit
+                 context_token_budget: int = None,  # planner/coder see only relevant script sections (context_builder)
+                 tracer: PipelineTracer = None,
+                 echo: bool = False,  # print every prompt and response
+                 api_url: str = None,  # default $OPENAI_API_URL, else OpenAI; or a compatible endpoint
+                 candidates: int = 1,  # coder/applier candidates per call, see select_candidate
+                 candidate_mode: str = "parallel",  # or "n"
+                 routes: Dict[str, StageRoute] = None):  # per-stage settings; missing stages get the default route
         """Initialize the simulator with OpenAI API key"""
         self.api_key = api_key or os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
+        self.cache = cache
+        self.context_token_budget = context_token_budget
+        self.tracer = tracer or PipelineTracer()
+        self.echo = echo
+        self.candidates = candidates
+        self.candidate_mode = candidate_mode
+        self.routes = dict(parse_routes({}), **(routes or {}))
+        self.api_url = api_url or os.getenv('OPENAI_API_URL') or OPENAI_API_URL
+        if not self.api_key and self.api_url == OPENAI_API_URL and not (cache and cache.replay_only):
             raise ValueError("OpenAI API key is required")
         
-        self.api_url = "https://api.openai.com/v1/chat/completions"
         self.headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
+            "Authorization": f"Bearer {self.api_key or 'none'}"
         }
+        self.client = LLMClient(self.api_url, self.headers, max_concurrency=max_concurrency,
+                                scheduler=scheduler)
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _build_payload(self, prompt: Union[str, Prompt], model: str, **options) -> dict:
+        # Stage prompts carry their static instructions as the system message; plain prompts get the generic one
+        system, user = prompt if isinstance(prompt, Prompt) else (html_system_template(), prompt)
+        payload = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system
+                },
+                {
+                    "role": "user",
+                    "content": user
+                }
+            ],
+            "temperature": 0.4
+        }
+        payload.update(options)
+        return payload
+
+    async def complete(self, prompt: Union[str, Prompt], model: str = "gpt-4o-mini", **options) -> Completion:
+        """Send a prompt to OpenAI's API and get the response with its finish_reason and usage.
+
+        options are extra request parameters, such as seed or max_tokens.
+        """
+        return (await self.complete_choices(prompt, model, **options))[0]
 
-    async def prompt_llm(self, prompt: str, model: str = "gpt-4o-mini") -> str:
+    async def complete_choices(self, prompt: Union[str, Prompt], model: str = "gpt-4o-mini", n: int = 1,
+                               **options) -> List[Completion]:
+        """Request n alternative completions of prompt in one call.
+
+        The request's usage covers all choices and is reported on the first.
+        """
+        payload = self._build_payload(prompt, model, **options)
+        if n > 1:
+            payload["n"] = n
+        # Each choice of an n > 1 request is cached on its own, under the payload plus its index
+        cache_payloads = [payload] if n == 1 else [dict(payload, choice=index) for index in range(n)]
+
+        if self.echo:
+            print(f"\033[32m{payload['messages'][-1]['content']}\033[0m")
+
+        start = time.perf_counter()
+        cached = []
+        if self.cache:
+            for cache_payload in cache_payloads:
+                entry = self.cache.get(cache_payload)
+                if entry is None:
+                    break
+                cached.append(entry)
+        if cached and len(cached) == n:
+            if self.echo:
+                for entry in cached:
+                    print(f"\033[33m{entry['response']}\033[0m")
+            self.tracer.record_call(model, time.perf_counter() - start, usage=cached[0]["usage"], cached=True,
+                                    finish_reason=cached[0]["finish_reason"])
+            return [Completion(entry["response"], entry["finish_reason"], entry["usage"]) for entry in cached]
+
+        result = {}
+        try:
+            response = await self.client.chat(payload, result)
+        except Exception as e:
+            print(f"Error calling OpenAI API: {str(e)}")
+            self.tracer.record_call(model, time.perf_counter() - start, error=describe_error(e))
+            raise
+        elapsed = time.perf_counter() - start
+
+        choices = sorted(response["choices"], key=lambda choice: choice.get("index", 0))
+        completions = [
+            Completion(choice["message"]["content"], choice.get("finish_reason"),
+                       response.get("usage") if index == 0 else None)
+            for index, choice in enumerate(choices)
+        ]
+        # Without streaming the first token arrives with the whole response
+        self.tracer.record_call(model, elapsed, elapsed, response.get("usage"), result.get("retries", 0),
+                                finish_reason=completions[0].finish_reason)
+
+        if self.echo:
+            for completion in completions:
+                print(f"\033[33m{completion.content}\033[0m")
+
+        if self.cache:
+            for cache_payload, completion in zip(cache_payloads, completions):
+                self.cache.put(cache_payload, *completion)
+        return completions
+
+    async def prompt_llm(self, prompt: Union[str, Prompt], model: str = "gpt-4o-mini", **options) -> str:
         """Send a prompt to OpenAI's API and get the response"""
-        max_retries = 5
-        retry_delay = 2  # Start with a 2-second delay
+        return (await self.complete(prompt, model, **options)).content
+
+    async def complete_with_continuation(self, prompt: Union[str, Prompt], context: str = "", model: str = "gpt-4o-mini",
+                                         max_rounds: int = 3, **options) -> Completion:
+        """Complete prompt, asking the continuer to resume whenever the reply is cut off at max_tokens.
+
+        Each round sends the continuer the last CONTINUATION_TAIL_CHARS of
+        the text so far along with context, and stitches the code it
+        returns onto the end, dropping any overlap it repeated. Usage is
+        summed over all rounds. options apply to every round.
+        """
+        completion = await self.complete(prompt, model, **options)
+        return await self.continue_completion(completion, context, model, max_rounds, **options)
+
+    async def continue_completion(self, completion: Completion, context: str = "", model: str = "gpt-4o-mini",
+                                  max_rounds: int = 3, **options) -> Completion:
+        """Continue a completion cut off at max_tokens, as complete_with_continuation does"""
+        content = completion.content
+        usage = {}
+        _add_usage(usage, completion.usage or {})
+        for round_number in range(1, max_rounds + 1):
+            if completion.finish_reason != "length":
+                break
+            print(f"Response truncated at max_tokens, continuing ({round_number}/{max_rounds})...")
+            continuer_prompt = programmer_agent_continuer(context, content[-CONTINUATION_TAIL_CHARS:])
+            completion = await self.complete(continuer_prompt, model, **options)
+            content = stitch_continuation(content, extract_code_block(completion.content))
+            _add_usage(usage, completion.usage or {})
+        if completion.finish_reason == "length":
+            print(f"Response still truncated after {max_rounds} continuation rounds")
+        return Completion(content, completion.finish_reason, usage)
+
+    async def prompt_llm_stream(self, prompt: Union[str, Prompt], model: str = "gpt-4o-mini", **options):
+        """Send a prompt to OpenAI's API and yield the response as it streams in"""
+        payload = self._build_payload(prompt, model, **options)
+
+        if self.echo:
+            print(f"\033[32m{payload['messages'][-1]['content']}\033[0m")
 
-        for attempt in range(max_retries):
+        start = time.perf_counter()
+        cached = self.cache.get(payload) if self.cache else None
+        if cached is not None:
+            if self.echo:
+                print(f"\033[33m{cached['response']}\033[0m")
+            self.tracer.record_call(model, time.perf_counter() - start, usage=cached["usage"], cached=True,
+                                    finish_reason=cached["finish_reason"])
+            yield cached["response"]
+            return
+
+        # Only a stream read to the end is cached; a consumer that stops early leaves nothing behind
+        chunks = []
+        result = {}
+        first_token_time = None
+        error = None
+        try:
+            async for chunk in self.client.stream_chat(payload, result):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start
+                if self.echo:
+                    print(f"\033[33m{chunk}\033[0m", end="", flush=True)
+                chunks.append(chunk)
+                yield chunk
+            if self.cache:
+                self.cache.put(payload, "".join(chunks), result.get("finish_reason"), result.get("usage"))
+        except Exception as e:
+            print(f"Error calling OpenAI API: {str(e)}")
+            error = describe_error(e)
+            raise
+        finally:
+            self.tracer.record_call(model, time.perf_counter() - start, first_token_time, result.get("usage"),
+                                    result.get("retries", 0), finish_reason=result.get("finish_reason"),
+                                    error=error)
+            if self.echo:
+                print()
+
+    async def select_candidate(self, prompt: Union[str, Prompt], validate, continuation_context: str = None,
+                               model: str = "gpt-4o-mini", **options) -> Completion:
+        """Generate self.candidates completions of prompt and return the first that validate() passes.
+
+        In "parallel" mode each candidate is its own request with a
+        different seed; they run concurrently, and the first to arrive and
+        pass wins while the rest are cancelled. In "n" mode they are the
+        choices of a single request. With continuation_context, candidates
+        cut off at max_tokens are continued before validation.
+        If no candidate passes, the one with the best validation is kept.
+        options are extra request parameters for every candidate.
+        """
+        best = None
+        errors = []
+
+        async def check(index: int, completion: Completion) -> Validation:
+            nonlocal best
+            validation = await asyncio.to_thread(validate, completion)
+            if best is None or validation.score() > best[1].score():
+                best = (completion, validation)
+            if validation.passed:
+                print(f"Candidate {index + 1} of {self.candidates} passed validation")
+            return validation
+
+        if self.candidate_mode == "n":
+            completions = await self.complete_choices(prompt, model, n=self.candidates, **options)
+            for index, completion in enumerate(completions):
+                if continuation_context is not None:
+                    # Choices share max_tokens, so long scripts are often cut off in all of them
+                    completion = await self.continue_completion(completion, continuation_context, model, **options)
+                if (await check(index, completion)).passed:
+                    return completion
+        else:
+            async def candidate(index: int):
+                # The first candidate sends the same request as a single call, so it shares its cache entry
+                request_options = dict(options, seed=index) if index else options
+                if continuation_context is not None:
+                    return index, await self.complete_with_continuation(prompt, continuation_context, model,
+                                                                        **request_options)
+                return index, await self.complete(prompt, model, **request_options)
+
+            tasks = [asyncio.create_task(candidate(index)) for index in range(self.candidates)]
             try:
-                payload = {
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": html_system_template()
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.4
-                }
+                for future in asyncio.as_completed(tasks):
+                    try:
+                        index, completion = await future
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if (await check(index, completion)).passed:
+                        return completion
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
-                print(f"\033[32m{prompt}\033[0m")
-
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload
-                )
-                response.raise_for_status()
-
-                response_content = response.json()["choices"][0]["message"]["content"]
-
-                print(f"\033[33m{response_content}\033[0m")
-
-                return response_content
-            
-            except requests.exceptions.HTTPError as e:
-                if response.status_code == 429:
-                    print(f"Rate limit hit. Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    print(f"Error calling OpenAI API: {str(e)}")
-                    raise
-            except Exception as e:
-                print(f"Unexpected error: {str(e)}")
+        if best is None:
+            raise errors[-1]
+        print(f"No candidate passed validation, keeping the best one: {'; '.join(best[1].problems)}")
+        return best[0]
+
+    async def _routed(self, stage: str, method, *args, **kwargs):
+        """Await a completion method with the stage's model and settings, retrying on its fallback model if it fails"""
+        route = self.routes[stage]
+        kwargs = dict(route.options(), **kwargs)
+        try:
+            return await method(*args, model=route.model, **kwargs)
+        except Exception as e:
+            if not route.fallback_model:
                 raise
+            print(f"{stage} call on {route.model} failed ({describe_error(e)}), falling back to {route.fallback_model}")
+            return await method(*args, model=route.fallback_model, **kwargs)
 
-        raise Exception("Max retries exceeded for OpenAI API request")
+    def _script_context(self, script: str, query: str) -> str:
+        if self.context_token_budget is None:
+            return script
+        return build_context(script, query, self.context_token_budget)
 
     async def design_tasks(self, query: str, script: str) -> str:
         """Use the planner to design tasks based on a query and script"""
-        planner_prompt = programmer_agent_planner(query, script)
-        return await self.prompt_llm(planner_prompt)
+        with self.tracer.stage("planner"):
+            planner_prompt = programmer_agent_planner(query, self._script_context(script, query))
+            return await self._routed("planner", self.prompt_llm, planner_prompt)
+
+    async def design_task_plan(self, query: str, script: str) -> TaskPlan:
+        """Use the structured planner to break a query into a JSON task list with dependencies.
+
+        A response that is not a usable task list becomes a plan with a
+        single task holding the whole response.
+        """
+        with self.tracer.stage("planner"):
+            planner_prompt = programmer_agent_structured_planner(query, self._script_context(script, query))
+            response = await self._routed("planner", self.prompt_llm, planner_prompt,
+                                          response_format={"type": "json_object"})
+        try:
+            return parse_task_plan(response)
+        except ValueError as e:
+            print(f"Could not use the planner's task list ({e}), coding it as one task")
+            return TaskPlan(query, [Task("t1", query, [response], [])], [])
 
     async def code_tasks(self, task_writeup: str, script: str) -> str:
         """Use the task coder to generate code snippets from a task writeup"""
-        coder_prompt = programmer_agent_task_coder(task_writeup, script, "")
-        return await self.prompt_llm(coder_prompt)
+        return await self._code(task_writeup, self._script_context(script, task_writeup))
+
+    async def code_task_plan(self, plan: TaskPlan, script: str) -> str:
+        """Code each task of a plan with its own coder call, then merge the snippets in plan order.
+
+        A task starts as soon as the tasks it depends on are coded, and sees
+        their snippets in its writeup, so independent tasks run
+        concurrently. Each call gets only the script sections relevant to
+        its task, within context_token_budget (TASK_CONTEXT_TOKEN_BUDGET if
+        unset).
+        """
+        budget = self.context_token_budget or TASK_CONTEXT_TOKEN_BUDGET
+        snippets = {}
+        coding = {}
+
+        async def code(task):
+            await asyncio.gather(*(coding[dependency] for dependency in task.depends_on))
+            task_writeup = task_scoped_writeup(plan, task, snippets)
+            snippets[task.id] = await self._code(task_writeup, build_context(script, task_writeup, budget))
+
+        # Waves are in dependency order, so every task's dependencies are scheduled before it
+        for wave in task_waves(plan):
+            for task in wave:
+                coding[task.id] = asyncio.create_task(code(task))
+        try:
+            await asyncio.gather(*coding.values())
+        finally:
+            for task in coding.values():
+                task.cancel()
+        return merge_snippets(plan, snippets)
+
+    async def _code(self, task_writeup: str, script_context: str) -> str:
+        with self.tracer.stage("coder"):
+            coder_prompt = programmer_agent_task_coder(task_writeup, script_context)
+            if self.candidates > 1:
+                completion = await self._routed("coder", self.select_candidate, coder_prompt,
+                                                lambda c: validate_snippets(c.content, c.finish_reason))
+                return completion.content
+            return await self._routed("coder", self.prompt_llm, coder_prompt)
 
     async def apply_code(self, code_snippets: str, script: str) -> str:
         """Use the task applier to integrate code snippets into the script"""
+        with self.tracer.stage("applier"):
+            applier_prompt = programmer_agent_task_applier(code_snippets, script)
+            if self.candidates > 1:
+                completion = await self._routed(
+                    "applier", self.select_candidate, applier_prompt,
+                    lambda c: validate_script(c.content, code_snippets, c.finish_reason),
+                    continuation_context=code_snippets)
+            else:
+                completion = await self._routed("applier", self.complete_with_continuation, applier_prompt,
+                                                code_snippets)
+            return completion.content
+
+    async def apply_code_patch(self, code_snippets: str, script: str):
+        """Have the model emit SEARCH/REPLACE edits and apply them to the script locally.
+
+        Returns (new_script, conflicts) where conflicts lists the edits that
+        could not be placed.
+        """
+        applier_prompt = programmer_agent_patch_applier(code_snippets, script)
+        with self.tracer.stage("applier"):
+            response = await self._routed("applier", self.prompt_llm, applier_prompt)
+        edits = parse_edits(response)
+        new_script, conflicts = apply_edits(script, edits)
+        print(f"Applied {len(edits) - len(conflicts)} of {len(edits)} edits")
+        for conflict in conflicts:
+            print(f"Edit {conflict.index} {conflict.reason}:\n{conflict.search}")
+        return new_script, conflicts
+
+    def apply_code_locally(self, code_snippets: str, script: str) -> str:
+        """Merge the coder's snippets into the script by tag and placement comments, without a model call"""
+        with self.tracer.stage("applier"):
+            new_script, placements = apply_snippets(script, code_snippets)
+        print(f"Placed {len(placements)} snippets locally")
+        return new_script
+
+    async def apply_code_to_file(self, code_snippets: str, script: str, path: str) -> bool:
+        """Stream the task applier's response, writing its HTML code block to path as it arrives.
+
+        Stops reading once the closing fence arrives. Returns False if the
+        stream ended without one, meaning the script was truncated. The
+        applier route's fallback model is not used, since a failed stream may
+        already have written part of the file.
+        """
         applier_prompt = programmer_agent_task_applier(code_snippets, script)
-        return await self.prompt_llm(applier_prompt)
+        code_block = FencedCodeStream()
+        with self.tracer.stage("applier"), open(path, "w", encoding="utf-8") as f:
+            route = self.routes["applier"]
+            async with aclosing(self.prompt_llm_stream(applier_prompt, route.model, **route.options())) as chunks:
+                async for chunk in chunks:
+                    f.write(code_block.feed(chunk))
+                    if code_block.done:
+                        break
+            f.write(code_block.finish())
+        return code_block.done
+
+    async def run_pipeline(self, query: str, script: str, applier: str = "full", fan_out: bool = False) -> Dict:
+        """Run planner, coder and applier for one request.
+
+        applier is "full" to have the model rewrite the whole script,
+        "patch" to apply model-written edits locally, or "local" to merge the
+        coder's snippets with no applier call at all. With fan_out, the
+        planner returns a task list and each task is coded by its own
+        concurrent coder call. Pipelines share the client's connection pool
+        and concurrency limit, so many can be awaited together with
+        asyncio.gather.
+        """
+        result = {}
+        if fan_out:
+            plan = await self.design_task_plan(query, script)
+            task_writeup = render_task_writeup(plan)
+            code_snippets = await self.code_task_plan(plan, script)
+            result["task_plan"] = plan
+        else:
+            task_writeup = await self.design_tasks(query, script)
+            code_snippets = await self.code_tasks(task_writeup, script)
+        result["task_writeup"] = task_writeup
+        result["code_snippets"] = code_snippets
+        if applier == "patch":
+            final_script, conflicts = await self.apply_code_patch(code_snippets, script)
+            result["final_script"] = final_script
+            result["conflicts"] = conflicts
+        elif applier == "local":
+            result["final_script"] = self.apply_code_locally(code_snippets, script)
+        else:
+            result["final_script"] = await self.apply_code(code_snippets, script)
+        return result
 
-def main(test_use_continuer: bool = False):
+def main(test_use_continuer: bool = False, stream: bool = False, use_cache: bool = True,
+         replay_only: bool = False, applier: str = "full", echo: bool = False, trace_path: str = None,
+         api_url: str = None, fan_out: bool = False):
     """Main function to run the simulator"""
-    simulator = ProgrammerAgentSimulator()
+    cache = ResponseCache(replay_only=replay_only) if use_cache or replay_only else None
+    tracer = PipelineTracer(trace_path)
+    simulator = ProgrammerAgentSimulator(cache=cache, tracer=tracer, echo=echo, api_url=api_url)
     
     user_prompt = "Add a toggle at the top of the app that toggles back and forth between dark and light mode. Also add three different themes to the app that the user can toggle between."
     html_script = open("PROJECT ZEUS (X).html", "r", encoding="utf-8").read()
 
     # Example workflow
-    loop = asyncio.get_event_loop()
-    task_writeup = loop.run_until_complete(simulator.design_tasks(user_prompt, html_script))
-    code_snippets = loop.run_until_complete(simulator.code_tasks(task_writeup, html_script))
-    final_script = loop.run_until_complete(simulator.apply_code(code_snippets, html_script))
-
-    # strip ```html and ```
-    key = '```html'
-    if "```javascript" in final_script:
-        key = '```javascript'
-    elif "```css" in final_script:
-        key = '```css'
-    use_continuer = False
-    try:
-        final_script = final_script.replace(key, "").replace("```", "")
-    except:
-        print("Script is not finished generating, using the continuer...")
-        use_continuer = True
-
-    final_script_continued = ""
-    if use_continuer or test_use_continuer:
+    loop = asyncio.new_event_loop()
+    if stream and not test_use_continuer:
+        # Write the applier output to disk as it streams instead of buffering it
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output_filename = f"output-{timestamp}.html"
+        task_writeup = loop.run_until_complete(simulator.design_tasks(user_prompt, html_script))
+        code_snippets = loop.run_until_complete(simulator.code_tasks(task_writeup, html_script))
+        complete = loop.run_until_complete(simulator.apply_code_to_file(code_snippets, html_script, output_filename))
+        loop.run_until_complete(simulator.close())
+        loop.close()
+        tracer.close()
+        tracer.print_summary()
+        if cache:
+            print(f"Response cache: {cache.stats()}")
+        print(f"Saved final script to {output_filename}")
+        if not complete:
+            print("Script stream ended before the closing code fence; the output is truncated")
+        return
+
+    result = loop.run_until_complete(simulator.run_pipeline(user_prompt, html_script, applier=applier,
+                                                                 fan_out=fan_out))
+    code_snippets = result["code_snippets"]
+    final_script = result["final_script"]
+
+    # The applier already continued any reply cut off at max_tokens, so just take its code block
+    final_script = extract_code_block(final_script)
+
+    if test_use_continuer:
         # test the continuer by removing the last 10% of the final script to the nearest /n
         final_script_snipped = final_script[:-int(len(final_script) * 0.1)]
         # find the nearest /n using .split('\n')[-1]
         final_script_snipped = '\n'.join(final_script_snipped.split('\n')[:-1])
         print("Using the continuer...")
-        prompt = programmer_agent_continuer(code_snippets, final_script_snipped)
+        prompt = programmer_agent_continuer(code_snippets, final_script_snipped[-CONTINUATION_TAIL_CHARS:])
         final_script_continued = loop.run_until_complete(simulator.prompt_llm(prompt))
+        final_script = stitch_continuation(final_script_snipped, extract_code_block(final_script_continued))
 
-        # The final script looks like:
-        # ```html
-        # <actual HTML content>
-        # ```
-        # So we need to extract just the HTML content between the markers
-        key = '```html'
-        if "```javascript" in final_script_continued:
-            key = '```javascript'
-        elif "```css" in final_script_continued:
-            key = '```css'
-        final_script_continued = final_script_continued.split(key)[1].split("```")[0].strip()
-
-        # concatenate the final script and the final script continued
-        final_script = final_script_snipped + final_script_continued
+    loop.run_until_complete(simulator.close())
+    loop.close()
+    tracer.close()
+    tracer.print_summary()
+    if cache:
+        print(f"Response cache: {cache.stats()}")
 
     # Save the final script to a file with timestamp
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
@@ -156,5 +551,12 @@ def main(test_use_continuer: bool = False):
 
 if __name__ == "__main__":
     main(
-        test_use_continuer=False
+        test_use_continuer=False,
+        stream=False,
+        use_cache=True,
+        replay_only=False,
+        applier="full",
+        echo=False,
+        trace_path="trace.jsonl",
+        fan_out=False
     )
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import List, Dict
+
+from agent import ProgrammerAgentSimulator
+from llm_client import describe_error
+from mock_server import MockLLMServer
+from code_blocks import extract_code_block
+from response_cache import ResponseCache
+from routing import STAGES, StageRoute, load_routing_tables, parse_routes
+from task_plan import render_task_writeup
+from tracing import PipelineTracer
+from validation import validate_writeup, validate_snippets, validate_script
+
+
+def load_jobs(path: str) -> List[Dict]:
+    """Read (query, script path) jobs from JSONL; script paths are relative to the jobs file"""
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            spec = json.loads(line)
+            jobs.append({
+                "id": str(spec.get("id", line_number)),
+                "query": spec["query"],
+                "script_path": os.path.join(base, spec["script_path"]),
+                "timings": {},
+                "valid": {}
+            })
+    return jobs
+
+
+async def _timed(job: Dict, stage: str, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        job["timings"][stage] = time.perf_counter() - start
+
+
+async def run_batch(simulator: ProgrammerAgentSimulator, jobs: List[Dict], output_dir: str,
+                    planner_concurrency: int = 4, coder_concurrency: int = 4, applier: str = "full",
+                    fan_out: bool = False) -> Dict:
+    """Run jobs through planner -> coder -> applier as a two-stage pipeline.
+
+    Planner workers keep planning later jobs while coder workers run the
+    coder and applier for jobs that are already planned, so the stages
+    overlap. Each job writes its outputs to output_dir/<job id>/.
+    With fan_out, the planner returns a task list and the coder stage
+    codes its tasks concurrently. Each stage's output is checked with the
+    validation module. Returns a summary with wall time and the share of
+    valid outputs per stage.
+    """
+    plan_queue = asyncio.Queue()
+    code_queue = asyncio.Queue(maxsize=coder_concurrency * 2)
+    failures = {}
+
+    def fail(job, stage, error):
+        failures[job["id"]] = f"{stage}: {describe_error(error)}"
+        print(f"Job {job['id']} failed in {stage}: {describe_error(error)}")
+
+    async def planner_worker():
+        while (job := await plan_queue.get()) is not None:
+            try:
+                with open(job["script_path"], "r", encoding="utf-8") as f:
+                    job["script"] = f.read()
+                if fan_out:
+                    job["plan"] = await _timed(job, "planner", simulator.design_task_plan(job["query"], job["script"]))
+                    job["task_writeup"] = render_task_writeup(job["plan"])
+                else:
+                    job["task_writeup"] = await _timed(job, "planner",
+                                                       simulator.design_tasks(job["query"], job["script"]))
+            except Exception as e:
+                fail(job, "planner", e)
+                continue
+            job["valid"]["planner"] = validate_writeup(job["task_writeup"]).passed
+            await code_queue.put(job)
+
+    async def coder_worker():
+        while (job := await code_queue.get()) is not None:
+            job_dir = os.path.join(output_dir, job["id"])
+            os.makedirs(job_dir, exist_ok=True)
+            stage = "coder"
+            try:
+                if "plan" in job:
+                    code_snippets = await _timed(job, "coder", simulator.code_task_plan(job["plan"], job["script"]))
+                else:
+                    code_snippets = await _timed(job, "coder",
+                                                 simulator.code_tasks(job["task_writeup"], job["script"]))
+                job["valid"]["coder"] = (await asyncio.to_thread(validate_snippets, code_snippets)).passed
+                stage = "applier"
+                conflicts = []
+                if applier == "patch":
+                    final_script, conflicts = await _timed(job, "applier",
+                                                           simulator.apply_code_patch(code_snippets, job["script"]))
+                    job["conflicts"] = len(conflicts)
+                elif applier == "local":
+                    final_script = await _timed(job, "applier", asyncio.to_thread(
+                        simulator.apply_code_locally, code_snippets, job["script"]))
+                else:
+                    final_script = extract_code_block(await _timed(job, "applier",
+                                                                   simulator.apply_code(code_snippets, job["script"])))
+                validation = await asyncio.to_thread(validate_script, final_script, code_snippets)
+                job["valid"]["applier"] = validation.passed and not conflicts
+            except Exception as e:
+                fail(job, stage, e)
+                continue
+            finally:
+                # Large scripts are only needed until the job's last stage
+                job.pop("script", None)
+
+            for name, content in (("task_writeup.md", job["task_writeup"]),
+                                  ("code_snippets.md", code_snippets),
+                                  ("final.html", final_script)):
+                with open(os.path.join(job_dir, name), "w", encoding="utf-8") as f:
+                    f.write(content)
+
+    start = time.perf_counter()
+    for job in jobs:
+        plan_queue.put_nowait(job)
+    for _ in range(planner_concurrency):
+        plan_queue.put_nowait(None)
+
+    coders = [asyncio.create_task(coder_worker()) for _ in range(coder_concurrency)]
+    await asyncio.gather(*(planner_worker() for _ in range(planner_concurrency)))
+    for _ in range(coder_concurrency):
+        await code_queue.put(None)
+    await asyncio.gather(*coders)
+    wall_time = time.perf_counter() - start
+
+    stage_times = defaultdict(list)
+    stage_valid = defaultdict(list)
+    for job in jobs:
+        for stage, seconds in job["timings"].items():
+            stage_times[stage].append(seconds)
+        for stage, valid in job["valid"].items():
+            stage_valid[stage].append(valid)
+    summary = {
+        "jobs": len(jobs),
+        "failed": failures,
+        "wall_time": wall_time,
+        "stages": {
+            stage: {
+                "count": len(stage_times[stage]),
+                "total": sum(stage_times[stage]),
+                "mean": sum(stage_times[stage]) / len(stage_times[stage]) if stage_times[stage] else 0.0,
+                "max": max(stage_times[stage], default=0.0),
+                "checked": len(stage_valid[stage]),
+                "valid": sum(stage_valid[stage])
+            }
+            for stage in STAGES
+        },
+        "per_job": {job["id"]: {"timings": job["timings"], "valid": job["valid"]} for job in jobs},
+        "llm": simulator.tracer.summary()
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_summary(summary: Dict):
+    print(f"\n{summary['jobs']} jobs in {summary['wall_time']:.1f}s wall time, {len(summary['failed'])} failed")
+    print(f"{'stage':<8} {'calls':>6} {'total s':>9} {'mean s':>8} {'max s':>8} {'valid':>9}")
+    for stage, stats in summary["stages"].items():
+        print(f"{stage:<8} {stats['count']:>6} {stats['total']:>9.1f} {stats['mean']:>8.1f} {stats['max']:>8.1f} "
+              f"{stats['valid']:>4}/{stats['checked']:<4}")
+
+
+def print_benchmark(results: Dict[str, Dict], routing_tables: Dict[str, Dict[str, StageRoute]]):
+    """Compare the batch summaries of several routing tables stage by stage"""
+    print(f"\n{'table':<16} {'stage':<8} {'model':<16} {'mean s':>8} {'prompt tok':>11} {'compl tok':>10} "
+          f"{'cost $':>8} {'valid':>9}")
+    for name, summary in results.items():
+        for stage in STAGES:
+            stats = summary["stages"][stage]
+            llm = summary["llm"].get(stage, {})
+            print(f"{name:<16} {stage:<8} {routing_tables[name][stage].model:<16} {stats['mean']:>8.1f} "
+                  f"{llm.get('prompt_tokens', 0):>11,} {llm.get('completion_tokens', 0):>10,} "
+                  f"{llm.get('cost', 0.0):>8.4f} {stats['valid']:>4}/{stats['checked']:<4}")
+
+
+async def _run(args, routes: Dict[str, StageRoute], output_dir: str, trace_path: str, cache: ResponseCache,
+               api_url: str) -> Dict:
+    tracer = PipelineTracer(trace_path)
+    try:
+        async with ProgrammerAgentSimulator(max_concurrency=args.planners + args.coders, cache=cache,
+                                            context_token_budget=args.context_budget,
+                                            tracer=tracer, echo=args.echo, api_url=api_url,
+                                            candidates=args.candidates,
+                                            candidate_mode=args.candidate_mode, routes=routes) as simulator:
+            summary = await run_batch(simulator, load_jobs(args.jobs), output_dir,
+                                      planner_concurrency=args.planners, coder_concurrency=args.coders,
+                                      applier=args.applier, fan_out=args.fan_out)
+    finally:
+        tracer.close()
+    print_summary(summary)
+    tracer.print_summary()
+    return summary
+
+
+async def _main(args, routing_tables: Dict[str, Dict[str, StageRoute]]):
+    cache = ResponseCache(replay_only=args.replay_only) if args.cache or args.replay_only else None
+    api_url = args.api_url
+    mock = None
+    if args.mock is not None:
+        # Benchmark the orchestration offline against recorded responses
+        mock = MockLLMServer(recordings=args.mock, latency=args.mock_latency, chunk_delay=args.mock_chunk_delay,
+                             truncate_rate=args.mock_truncate_rate, seed=args.mock_seed)
+        api_url = await mock.start()
+    try:
+        if args.benchmark:
+            # Same jobs under each routing table, one after another so they do not compete for rate limits
+            results = {}
+            for name, routes in routing_tables.items():
+                print(f"\nRouting table {name}")
+                output_dir = os.path.join(args.out, name)
+                results[name] = await _run(args, routes, output_dir, args.trace and f"{args.trace}.{name}",
+                                           cache, api_url)
+            print_benchmark(results, routing_tables)
+            with open(os.path.join(args.out, "benchmark.json"), "w", encoding="utf-8") as f:
+                json.dump({name: {"routes": {stage: route._asdict() for stage, route in routing_tables[name].items()},
+                                  "summary": summary} for name, summary in results.items()}, f, indent=2)
+        else:
+            routes = routing_tables[args.table] if args.table else next(iter(routing_tables.values()))
+            await _run(args, routes, args.out, args.trace, cache, api_url)
+    finally:
+        if mock:
+            await mock.stop()
+    if mock:
+        print(f"Mock server: {mock.stats}")
+    if cache:
+        print(f"Response cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the programmer agent over a JSONL of jobs")
+    parser.add_argument("jobs", help='JSONL with one {"query": ..., "script_path": ...} job per line')
+    parser.add_argument("--out", default="batch-output", help="directory for per-job outputs and summary.json")
+    parser.add_argument("--planners", type=int, default=4, help="concurrent planner calls")
+    parser.add_argument("--coders", type=int, default=4, help="concurrent coder/applier jobs")
+    parser.add_argument("--applier", choices=("full", "patch", "local"), default="full")
+    parser.add_argument("--fan-out", action="store_true",
+                        help="plan a JSON task list and code its tasks concurrently")
+    parser.add_argument("--candidates", type=int, default=1,
+                        help="coder/applier candidates per call; the first that validates is kept")
+    parser.add_argument("--candidate-mode", choices=("parallel", "n"), default="parallel",
+                        help="concurrent requests, or one request with n choices")
+    parser.add_argument("--routing", help="JSON routing table, or object of named tables, giving each stage's "
+                                              "model, temperature, max_tokens and fallback_model")
+    parser.add_argument("--table", help="routing table to use when --routing holds several")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="run the jobs once per routing table and compare latency, tokens and validity per stage")
+    parser.add_argument("--context-budget", type=int, help="token budget for planner/coder script context")
+    parser.add_argument("--cache", action="store_true", help="answer repeated prompts from .llm_cache/")
+    parser.add_argument("--replay-only", action="store_true", help="never call the API, only the cache")
+    parser.add_argument("--trace", help="append a JSONL event per LLM call and stage to this file")
+    parser.add_argument("--echo", action="store_true", help="print every prompt and response")
+    parser.add_argument("--api-url", help="chat completions endpoint (default $OPENAI_API_URL, else OpenAI)")
+    parser.add_argument("--mock", nargs="?", const="", metavar="RECORDINGS",
+                        help="run against an in-process mock server, answering from a recorded cache directory")
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="mock seconds before the first byte")
+    parser.add_argument("--mock-chunk-delay", type=float, default=0.0, help="mock seconds between streamed chunks")
+    parser.add_argument("--mock-truncate-rate", type=float, default=0.0, help="fraction of mock replies cut short")
+    parser.add_argument("--mock-seed", type=int, default=0)
+    args = parser.parse_args()
+    routing_tables = load_routing_tables(args.routing) if args.routing else {"default": parse_routes({})}
+    if args.table and args.table not in routing_tables:
+        parser.error(f"no routing table {args.table} in {args.routing}")
+    if len(routing_tables) > 1 and not (args.table or args.benchmark):
+        parser.error(f"{args.routing} holds several routing tables; pick one with --table or use --benchmark")
+    asyncio.run(_main(args, routing_tables))
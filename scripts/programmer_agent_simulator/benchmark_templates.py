@@ -0,0 +1,47 @@
+import timeit
+
+from templates import PromptTemplate, _TASK_CODER_INSTRUCTIONS, _TASK_CODER_TEMPLATE, programmer_agent_task_coder
+
+# The task coder prompt as the single multi-KB literal it was before instructions moved to the system message
+_TASK_CODER_LITERAL = _TASK_CODER_INSTRUCTIONS + "\n\n" + _TASK_CODER_TEMPLATE.text
+_TASK_CODER_LITERAL_TEMPLATE = PromptTemplate(_TASK_CODER_LITERAL)
+
+
+def render_chained(script: str, task_writeup: str) -> str:
+    """The chained str.replace rendering the templates used before PromptTemplate"""
+    return _TASK_CODER_LITERAL.replace('<!script>', script)\
+                              .replace('<!task_writeup>', task_writeup)
+
+
+def render_single_pass(script: str, task_writeup: str) -> str:
+    return _TASK_CODER_LITERAL_TEMPLATE.render(script=script, task_writeup=task_writeup)
+
+
+def render_split(script: str, task_writeup: str) -> str:
+    """The current prompt: static system message, with only the user suffix rendered per call"""
+    return programmer_agent_task_coder(task_writeup, script).user
+
+
+def make_script(size: int) -> str:
+    line = '<div class="card"><p>Lorem ipsum dolor sit amet</p></div>\n'
+    return (line * (size // len(line) + 1))[:size]
+
+
+def main():
+    """Print render time per call for the task coder prompt across script sizes"""
+    task_writeup = "# Tasks\n1. Add a dark mode toggle\n" * 20
+    print(f"{len(_TASK_CODER_LITERAL):,} character template")
+    print(f"{'script size':>12} {'chained replace':>16} {'single pass':>12} {'speedup':>8} {'split prompt':>13}")
+    for size in (10_000, 100_000, 1_000_000, 5_000_000):
+        script = make_script(size)
+        assert render_chained(script, task_writeup) == render_single_pass(script, task_writeup)
+        number = max(5, 2_000_000 // size)
+        chained = min(timeit.repeat(lambda: render_chained(script, task_writeup), number=number, repeat=5)) / number
+        single = min(timeit.repeat(lambda: render_single_pass(script, task_writeup), number=number, repeat=5)) / number
+        split = min(timeit.repeat(lambda: render_split(script, task_writeup), number=number, repeat=5)) / number
+        print(f"{size:>12,} {chained * 1e6:>13.1f} us {single * 1e6:>9.1f} us {chained / single:>7.2f}x "
+              f"{split * 1e6:>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+FENCE = "```"
+
+
+class FencedCodeStream:
+    """Pull the contents of the first markdown code block out of streamed text.
+
+    Lines before the opening fence are dropped, unless one starts with "<",
+    in which case the model skipped the fence (the prompt already opened
+    one) and the code starts there. feed() returns the code that is safe to
+    write so far, holding back only a possible start of the closing fence.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_code = False
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += text
+        if not self._in_code and not self._find_code_start():
+            return ""
+
+        end = self._buffer.find("\n" + FENCE)
+        if end != -1:
+            code = self._buffer[:end + 1]
+            self._buffer = ""
+            self.done = True
+            return code
+
+        # Keep a trailing partial line that might still become the closing fence
+        newline = self._buffer.rfind("\n")
+        if newline != -1 and FENCE.startswith(self._buffer[newline + 1:]):
+            code, self._buffer = self._buffer[:newline], self._buffer[newline:]
+        else:
+            code, self._buffer = self._buffer, ""
+        return code
+
+    def finish(self) -> str:
+        """Return whatever is still held back once the stream has ended"""
+        code = self._buffer if self._in_code and not self.done else ""
+        self._buffer = ""
+        return code
+
+    def _find_code_start(self) -> bool:
+        while "\n" in self._buffer:
+            line, rest = self._buffer.split("\n", 1)
+            stripped = line.strip()
+            if stripped.startswith(FENCE):
+                self._buffer = rest
+                self._in_code = True
+                return True
+            if stripped.startswith("<"):
+                self._in_code = True
+                return True
+            self._buffer = rest
+        return False
+
+
+def extract_code_block(text: str) -> str:
+    """Contents of the first code block in a complete response, or the text itself if it has no fence"""
+    if FENCE not in text:
+        return text
+    code_block = FencedCodeStream()
+    return code_block.feed(text) + code_block.finish()
+
+
+def stitch_continuation(head: str, continuation: str, min_overlap: int = 16) -> str:
+    """Append continuation to head, dropping any text the model repeated from head's end.
+
+    The longest suffix of head that continuation starts with is removed
+    (at least min_overlap characters), or else a restart of head's
+    unfinished last line.
+    """
+    anchor = continuation[:min_overlap]
+    if len(anchor) == min_overlap:
+        position = head.find(anchor, max(0, len(head) - len(continuation)))
+        while position != -1:
+            if continuation.startswith(head[position:]):
+                return head + continuation[len(head) - position:]
+            position = head.find(anchor, position + 1)
+
+    # The model often restarts the line it was cut off in
+    partial_line = head[head.rfind("\n") + 1:]
+    if partial_line.strip() and continuation.startswith(partial_line):
+        return head + continuation[len(partial_line):]
+    return head + continuation
@@ -0,0 +1,152 @@
+import re
+import math
+from collections import Counter
+from typing import List, NamedTuple
+
+# Sections of markup or code longer than this are split so they can be ranked separately
+MAX_SECTION_LINES = 60
+
+_BLOCK = re.compile(r"<(style|script)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_-]{2,}")
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "into", "add", "use", "make",
+    "should", "when", "each", "are", "all", "any", "also", "task", "tasks", "code",
+    "html", "script", "user", "new", "between", "back", "forth", "different", "can"
+}
+
+
+class Section(NamedTuple):
+    kind: str  # "style", "script" or "dom"
+    start_line: int
+    end_line: int
+    text: str
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _split_lines(kind: str, text: str, start_line: int) -> List[Section]:
+    lines = text.split("\n")
+    return [
+        Section(kind, start_line + i, start_line + min(i + MAX_SECTION_LINES, len(lines)) - 1,
+                "\n".join(lines[i:i + MAX_SECTION_LINES]))
+        for i in range(0, len(lines), MAX_SECTION_LINES)
+    ]
+
+
+def split_sections(script: str) -> List[Section]:
+    """Split an HTML script into <style>, <script> and surrounding DOM sections, in order"""
+    sections = []
+    position = 0
+    line = 1
+    for match in _BLOCK.finditer(script):
+        markup = script[position:match.start()]
+        if markup.strip():
+            sections.extend(_split_lines("dom", markup, line))
+        line += markup.count("\n")
+        sections.extend(_split_lines(match.group(1).lower(), match.group(0), line))
+        line += match.group(0).count("\n")
+        position = match.end()
+    if script[position:].strip():
+        sections.extend(_split_lines("dom", script[position:], line))
+    return sections
+
+
+def _terms(text: str) -> List[str]:
+    terms = []
+    for word in _WORD.findall(text):
+        word = word.lower()
+        if word not in _STOPWORDS:
+            terms.append(word)
+            # Also index the parts of compounds such as "dark-mode" or "theme_toggle"
+            terms.extend(part for part in re.split(r"[-_]", word) if len(part) > 2 and part != word)
+    return terms
+
+
+def rank_sections(sections: List[Section], query: str) -> List[float]:
+    """BM25-style keyword relevance of each section to the query"""
+    query_terms = set(_terms(query))
+    section_terms = [Counter(_terms(section.text)) for section in sections]
+    document_frequency = Counter(term for counts in section_terms for term in counts if term in query_terms)
+    average_length = sum(sum(counts.values()) for counts in section_terms) / max(len(sections), 1) or 1
+
+    scores = []
+    for counts in section_terms:
+        length = sum(counts.values())
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(sections) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * length / average_length))
+        scores.append(score)
+    return scores
+
+
+def outline_section(section: Section) -> str:
+    """One-line summary of a section that was left out of the prompt"""
+    if section.kind == "style":
+        names = re.findall(r"([^{}\n]+?)\s*\{", section.text)
+        names = [name.strip() for name in names if not name.strip().startswith("<")]
+    elif section.kind == "script":
+        names = re.findall(r"function\s+([A-Za-z_$][\w$]*)|(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=", section.text)
+        names = [a or b for a, b in names]
+    else:
+        names = re.findall(r"""\b(?:id|class)=["']([^"']+)["']""", section.text)
+    names = list(dict.fromkeys(names))
+    if names:
+        summary = ", ".join(names[:8]) + (f" (+{len(names) - 8} more)" if len(names) > 8 else "")
+    else:
+        summary = next((line.strip()[:60] for line in section.text.split("\n") if line.strip()), "")
+    return f"<!-- omitted {section.kind} lines {section.start_line}-{section.end_line}: {summary} -->"
+
+
+def _cost(text: str) -> int:
+    # Rounded up, plus the newline that joins it, so the pieces' costs add up to at most the budget
+    return (len(text) + 4) // 4
+
+
+def build_context(script: str, query: str, token_budget: int = 6000) -> str:
+    """Return the script if it fits token_budget, else its most relevant sections plus an outline of the rest.
+
+    The budget goes first to sections relevant to the query, best first,
+    then to the smallest remaining sections, which are usually structural
+    markup. What is left pays for one-line outlines of omitted sections,
+    most relevant first; sections that get neither are counted in a final
+    summary line. Everything is rendered in the script's original order.
+    """
+    if estimate_tokens(script) <= token_budget:
+        return script
+
+    sections = split_sections(script)
+    scores = rank_sections(sections, query)
+    # Keep room for the closing summary line at its longest
+    remaining = token_budget - _cost(f"<!-- {len(sections)} more sections omitted -->")
+
+    relevant = sorted((i for i in range(len(sections)) if scores[i] > 0), key=lambda i: -scores[i])
+    rest = sorted((i for i in range(len(sections)) if scores[i] <= 0), key=lambda i: len(sections[i].text))
+    selected = set()
+    for index in relevant + rest:
+        cost = _cost(sections[index].text)
+        if cost <= remaining:
+            selected.add(index)
+            remaining -= cost
+
+    outlines = {}
+    for index in relevant + sorted(i for i in rest if i not in selected):
+        if index in selected:
+            continue
+        outline = outline_section(sections[index])
+        if _cost(outline) > remaining:
+            break
+        outlines[index] = outline
+        remaining -= _cost(outline)
+
+    parts = [section.text if index in selected else outlines[index]
+             for index, section in enumerate(sections) if index in selected or index in outlines]
+    omitted = len(sections) - len(parts)
+    if omitted:
+        parts.append(f"<!-- {omitted} more sections omitted -->")
+    return "\n".join(parts)
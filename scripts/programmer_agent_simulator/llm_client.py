@@ -0,0 +1,140 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+import aiohttp
+
+from rate_limiter import RateLimitScheduler, estimate_tokens, retry_after_seconds
+
+
+def describe_error(error: BaseException) -> str:
+    """Type, HTTP status and message of an error, safe to log: an aiohttp error's repr holds the request headers"""
+    status = getattr(error, "status", None)
+    message = getattr(error, "message", None) or str(error)
+    return f"{type(error).__name__}: {status} {message}" if status else f"{type(error).__name__}: {message}"
+
+
+class Completion(NamedTuple):
+    content: str
+    finish_reason: str  # "stop", or "length" when the reply hit max_tokens
+    usage: dict
+
+
+class LLMClient:
+    """Async client for an OpenAI-compatible chat completions endpoint.
+
+    All requests share one keep-alive connection pool, and at most
+    max_concurrency requests are in flight at once. Every request first
+    reserves budget from the scheduler. A 429 pauses the scheduler for the
+    server's Retry-After. 429s, 5xx responses and connection errors are
+    retried with jittered backoff.
+    """
+
+    def __init__(self, api_url: str, headers: dict, max_concurrency: int = 8,
+                 max_retries: int = 5, timeout: float = 600, scheduler: RateLimitScheduler = None):
+        self.api_url = api_url
+        self.headers = headers
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.scheduler = scheduler or RateLimitScheduler()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Create the pooled session on first use, inside the running event loop"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    @asynccontextmanager
+    async def _post(self, payload: dict, result: dict = None):
+        """Yield a successful response to payload, retrying transient failures.
+
+        Errors raised while the caller reads the response are not retried,
+        since part of it may already have been consumed. If given, result
+        records how many retries it took.
+        """
+        tokens = estimate_tokens(payload)
+
+        for attempt in range(self.max_retries):
+            await self.scheduler.acquire(tokens)
+            async with self._semaphore:
+                try:
+                    response = await self._get_session().post(self.api_url, json=payload)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    delay = self.scheduler.backoff_delay(attempt)
+                    print(f"Request failed ({describe_error(e)}). Retrying in {delay:.1f} seconds...")
+                    await asyncio.sleep(delay)
+                    continue
+
+                try:
+                    self.scheduler.update_from_headers(response.headers)
+                    if response.status != 429 and response.status < 500:
+                        response.raise_for_status()
+                        if result is not None:
+                            result["retries"] = attempt
+                        yield response
+                        return
+                    retry_after = retry_after_seconds(response.headers)
+                finally:
+                    response.release()
+
+            # Back off outside the semaphore so other requests can proceed
+            if response.status == 429:
+                delay = retry_after if retry_after is not None else self.scheduler.backoff_delay(attempt)
+                self.scheduler.pause(delay)
+                print(f"Rate limit hit. Retrying in {delay:.1f} seconds...")
+            else:
+                delay = self.scheduler.backoff_delay(attempt)
+                print(f"Server error {response.status}. Retrying in {delay:.1f} seconds...")
+                await asyncio.sleep(delay)
+
+        raise Exception("Max retries exceeded for OpenAI API request")
+
+    async def chat(self, payload: dict, result: dict = None) -> dict:
+        """POST a chat completion request and return the decoded JSON body"""
+        async with self._post(payload, result) as response:
+            return await response.json()
+
+    async def stream_chat(self, payload: dict, result: dict = None):
+        """POST a streaming chat completion and yield content deltas as they arrive.
+
+        If given, result is filled in with the retry count, and with the
+        stream's finish_reason and usage once they arrive.
+        """
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+
+        async with self._post(payload, result) as response:
+            # Server-sent events: one "data: {json}" line per chunk
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:"):].strip()
+                if data == b"[DONE]":
+                    return
+                chunk = json.loads(data)
+                if result is not None and chunk.get("usage"):
+                    result["usage"] = chunk["usage"]
+                for choice in chunk.get("choices", []):
+                    if result is not None and choice.get("finish_reason"):
+                        result["finish_reason"] = choice["finish_reason"]
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
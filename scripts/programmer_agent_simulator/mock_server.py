@@ -0,0 +1,213 @@
+import json
+import time
+import hashlib
+import random
+import asyncio
+import argparse
+from collections import deque
+from aiohttp import web
+
+from rate_limiter import estimate_prompt_tokens, estimate_tokens
+from response_cache import ResponseCache
+
+DEFAULT_RESPONSE = "```html\n<!DOCTYPE html>\n<html>\n<body>\n<p>Mock response</p>\n</body>\n</html>\n```"
+
+
+class MockLLMServer:
+    """Local stand-in for the OpenAI chat completions endpoint, for offline runs and benchmarks.
+
+    Replies come from recordings, a ResponseCache directory such as the one
+    the simulator fills with --cache, matched by request payload. Requests
+    that were never recorded get default_response. On top of that the
+    server can add latency before the first byte and between streamed
+    chunks, enforce requests/tokens per minute with 429s and x-ratelimit-*
+    headers, inject random 429s, and cut replies short with finish_reason
+    "length". Random choices come from a seeded RNG, so a run can be
+    repeated exactly.
+    """
+
+    def __init__(self, recordings: str = None, default_response: str = DEFAULT_RESPONSE,
+                 latency: float = 0.0, chunk_delay: float = 0.0, chunk_chars: int = 16,
+                 requests_per_minute: int = None, tokens_per_minute: int = None,
+                 rate_limit_rate: float = 0.0, truncate_rate: float = 0.0,
+                 max_completion_tokens: int = None, seed: int = 0):
+        self.recordings = ResponseCache(recordings) if recordings else None
+        self.default_response = default_response
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = chunk_chars
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.rate_limit_rate = rate_limit_rate
+        self.truncate_rate = truncate_rate
+        self.max_completion_tokens = max_completion_tokens
+        self.window = 60.0
+        self._random = random.Random(seed)
+        self._sent = deque()  # (monotonic time, estimated tokens) of accepted requests
+        self._seen_prefixes = set()
+        self._runner = None
+        self.stats = {"requests": 0, "rate_limited": 0, "truncated": 0, "recorded": 0, "default": 0}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.handle_chat)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve in the running event loop and return the chat completions URL; port 0 picks a free port"""
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _rate_limit_headers(self, now: float) -> dict:
+        headers = {}
+        reset = self._sent[0][0] + self.window - now if self._sent else 0.0
+        if self.requests_per_minute:
+            headers["x-ratelimit-limit-requests"] = str(self.requests_per_minute)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.requests_per_minute - len(self._sent)))
+            headers["x-ratelimit-reset-requests"] = f"{int(reset * 1000)}ms"
+        if self.tokens_per_minute:
+            used = sum(tokens for _, tokens in self._sent)
+            headers["x-ratelimit-limit-tokens"] = str(self.tokens_per_minute)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tokens_per_minute - used))
+            headers["x-ratelimit-reset-tokens"] = f"{int(reset * 1000)}ms"
+        return headers
+
+    def _admit(self, tokens: int):
+        """Reserve budget for a request, or return the 429 response that rejects it"""
+        now = time.monotonic()
+        while self._sent and self._sent[0][0] <= now - self.window:
+            self._sent.popleft()
+        over_requests = self.requests_per_minute and len(self._sent) >= self.requests_per_minute
+        over_tokens = (self.tokens_per_minute and self._sent
+                       and sum(t for _, t in self._sent) + tokens > self.tokens_per_minute)
+        injected = self._random.random() < self.rate_limit_rate
+        if over_requests or over_tokens or injected:
+            self.stats["rate_limited"] += 1
+            headers = self._rate_limit_headers(now)
+            retry_after = self._sent[0][0] + self.window - now if (over_requests or over_tokens) else 1.0
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            return web.json_response({"error": {"message": "Rate limit reached", "type": "requests",
+                                                "code": "rate_limit_exceeded"}}, status=429, headers=headers)
+        self._sent.append((now, tokens))
+        return None
+
+    def _cached_prompt_tokens(self, payload: dict) -> int:
+        """Mimic provider prefix caching: a repeated system message of 1024+ tokens is served from cache"""
+        messages = payload.get("messages") or []
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        system = messages[0].get("content") or ""
+        key = hashlib.sha256(f"{payload.get('model')}\0{system}".encode("utf-8")).hexdigest()
+        seen = key in self._seen_prefixes
+        self._seen_prefixes.add(key)
+        tokens = len(system) // 4
+        # Providers cache prefixes of at least 1024 tokens, in 128-token steps
+        return tokens // 128 * 128 if seen and tokens >= 1024 else 0
+
+    def _reply(self, payload: dict):
+        """Pick the reply to payload and apply truncation: (content, finish_reason)"""
+        entry = self.recordings.get(payload) if self.recordings else None
+        if entry is not None:
+            self.stats["recorded"] += 1
+            content = entry["response"]
+        else:
+            self.stats["default"] += 1
+            content = self.default_response
+
+        limits = [limit for limit in (payload.get("max_tokens"), payload.get("max_completion_tokens"),
+                                      self.max_completion_tokens) if limit]
+        cut = min(limits) * 4 if limits else None
+        if self._random.random() < self.truncate_rate:
+            random_cut = int(len(content) * self._random.uniform(0.3, 0.9))
+            cut = min(cut, random_cut) if cut is not None else random_cut
+        if cut is not None and cut < len(content):
+            self.stats["truncated"] += 1
+            return content[:cut], "length"
+        return content, "stop"
+
+    async def handle_chat(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.stats["requests"] += 1
+        prompt_tokens = estimate_prompt_tokens(payload)
+        prompt_details = {"cached_tokens": self._cached_prompt_tokens(payload)}
+
+        rejection = self._admit(estimate_tokens(payload))
+        if rejection is not None:
+            return rejection
+        headers = self._rate_limit_headers(time.monotonic())
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if not payload.get("stream"):
+            choices = [self._reply(payload) for _ in range(payload.get("n") or 1)]
+            completion_tokens = sum(len(content) // 4 for content, _ in choices)
+            return web.json_response({
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": index, "message": {"role": "assistant", "content": content},
+                             "finish_reason": finish_reason}
+                            for index, (content, finish_reason) in enumerate(choices)],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": prompt_details}
+            }, headers=headers)
+
+        content, finish_reason = self._reply(payload)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4, "prompt_tokens_details": prompt_details}
+
+        response = web.StreamResponse(headers=dict(headers, **{"Content-Type": "text/event-stream"}))
+        await response.prepare(request)
+
+        async def send(chunk: dict):
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        for start in range(0, len(content), self.chunk_chars):
+            if start and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            await send({"object": "chat.completion.chunk",
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + self.chunk_chars]},
+                                     "finish_reason": None}]})
+        await send({"object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            await send({"object": "chat.completion.chunk", "choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--recordings", help="ResponseCache directory to answer recorded prompts from")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first byte")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--rpm", type=int, help="requests per minute before answering 429")
+    parser.add_argument("--tpm", type=int, help="tokens per minute before answering 429")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="fraction of replies cut short")
+    parser.add_argument("--max-completion-tokens", type=int, help="cut replies longer than this")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockLLMServer(recordings=args.recordings, latency=args.latency, chunk_delay=args.chunk_delay,
+                           requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                           rate_limit_rate=args.rate_limit_rate, truncate_rate=args.truncate_rate,
+                           max_completion_tokens=args.max_completion_tokens, seed=args.seed)
+    print(f"Mock chat completions at http://{args.host}:{args.port}/v1/chat/completions")
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    _main()
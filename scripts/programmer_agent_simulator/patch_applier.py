@@ -0,0 +1,98 @@
+import re
+import difflib
+from typing import List, Tuple, NamedTuple
+
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+_EDIT_BLOCK = re.compile(
+    r"^<{5,} SEARCH[ \t]*\n(.*?)^={5,}[ \t]*\n(.*?)^>{5,} REPLACE[ \t]*$",
+    re.MULTILINE | re.DOTALL
+)
+
+
+class Edit(NamedTuple):
+    search: str
+    replace: str
+
+
+class EditConflict(NamedTuple):
+    index: int
+    reason: str
+    search: str
+
+
+def parse_edits(response: str) -> List[Edit]:
+    """Extract SEARCH/REPLACE blocks from a model response, in order"""
+    return [Edit(search, replace) for search, replace in _EDIT_BLOCK.findall(response)]
+
+
+def _normalize(line: str) -> str:
+    return " ".join(line.split())
+
+
+def _find_anchor(lines: List[str], search_lines: List[str], min_similarity: float):
+    """Locate search_lines in lines; returns (start, reason) where start is None on conflict.
+
+    Tries an exact match, then one that ignores whitespace differences, then
+    the most similar window of the same length.
+    """
+    n = len(search_lines)
+    starts = range(len(lines) - n + 1)
+
+    for same in (lambda a, b: a == b, lambda a, b: _normalize(a) == _normalize(b)):
+        matches = [i for i in starts if same(lines[i], search_lines[0])
+                   and all(same(x, y) for x, y in zip(lines[i:i + n], search_lines))]
+        if len(matches) == 1:
+            return matches[0], None
+        if len(matches) > 1:
+            return None, f"ambiguous: matches {len(matches)} places"
+
+    target = "\n".join(_normalize(line) for line in search_lines)
+    normalized = [_normalize(line) for line in lines]
+    best_start, best_ratio = None, 0.0
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for i in starts:
+        matcher.set_seq1("\n".join(normalized[i:i + n]))
+        if matcher.real_quick_ratio() < max(best_ratio, min_similarity):
+            continue
+        if matcher.quick_ratio() < max(best_ratio, min_similarity):
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best_start, best_ratio = i, ratio
+    if best_start is not None and best_ratio >= min_similarity:
+        return best_start, None
+    return None, f"not found (no window at least {min_similarity:.0%} similar)"
+
+
+def apply_edits(script: str, edits: List[Edit], min_similarity: float = 0.85) -> Tuple[str, List[EditConflict]]:
+    """Apply edits to script one after another.
+
+    Edits whose SEARCH text cannot be placed unambiguously are skipped and
+    reported as conflicts; the rest still apply. An empty SEARCH appends
+    the replacement to the end of the script.
+    """
+    lines = script.split("\n")
+    conflicts = []
+    for index, edit in enumerate(edits):
+        replace_lines = edit.replace.split("\n")
+        if replace_lines and replace_lines[-1] == "":
+            replace_lines.pop()
+        search_lines = edit.search.split("\n")
+        if search_lines and search_lines[-1] == "":
+            search_lines.pop()
+
+        if not search_lines:
+            lines.extend(replace_lines)
+            continue
+
+        start, reason = _find_anchor(lines, search_lines, min_similarity)
+        if start is None:
+            conflicts.append(EditConflict(index, reason, edit.search))
+            continue
+        lines[start:start + len(search_lines)] = replace_lines
+
+    return "\n".join(lines), conflicts
@@ -1,5 +1,9 @@
+import os
 import json
-from agent import ProgrammerAgentSimulator
+import time
+import argparse
+
+from snippet_applier import apply_snippets
 
 def load_html(file_path: str) -> str:
     """Load HTML content from a file."""
@@ -7,32 +11,56 @@ def load_html(file_path: str) -> str:
         return file.read()
 
 def load_responses(file_path: str) -> list:
-    """Load coder responses from a JSON file."""
+    """Load coder responses from a file.
+
+    JSON files may hold one response string, a list of them, or objects
+    with a "response" or "code_snippets" field (such as response cache
+    entries). Any other file is read as a single raw response, like the
+    code_snippets.md that batch_runner.py writes.
+    """
     with open(file_path, "r", encoding="utf-8") as file:
-        return json.load(file)
+        if not file_path.endswith(".json"):
+            return [file.read()]
+        data = json.load(file)
+    if not isinstance(data, list):
+        data = [data]
+    return [item if isinstance(item, str) else item.get("response") or item.get("code_snippets", "")
+            for item in data]
 
 def save_html(file_path: str, content: str):
     """Save HTML content to a file."""
     with open(file_path, "w", encoding="utf-8") as file:
         file.write(content)
 
-def main():
-    # Load the original HTML script
-    original_html = load_html("new-html-2024-11-01-19-02-24.html")
-    
-    # Load the cached coder responses
-    coder_responses = load_responses("coder-responses-2024-11-01-20-33-19.json")
+def process_file(original_html: str, responses_path: str, output_path: str):
+    """Apply every coder response in responses_path to original_html, in order, and save the result"""
+    start = time.perf_counter()
+    new_html = original_html
+    for response in load_responses(responses_path):
+        new_html, placements = apply_snippets(new_html, response)
+        for snippet, where in placements:
+            print(f"  {snippet.kind:<8} -> {where}")
+    save_html(output_path, new_html)
+    print(f"{responses_path} -> {output_path} in {(time.perf_counter() - start) * 1000:.1f} ms")
 
-    # Initialize the simulator
-    simulator = ProgrammerAgentSimulator()
-
-    # Apply the changes
-    new_html = simulator.apply_changes(original_html, coder_responses)
+def main():
+    parser = argparse.ArgumentParser(description="Apply cached task coder responses to an HTML script without any LLM call")
+    parser.add_argument("html", help="original HTML script")
+    parser.add_argument("responses", nargs="+", help="coder response files (.json, or raw text such as code_snippets.md)")
+    parser.add_argument("--out-dir", default="processed", help="directory for one processed HTML file per response file")
+    args = parser.parse_args()
 
-    # Save the new HTML to a file
-    save_html("processed.html", new_html)
+    # Load the original HTML script
+    original_html = load_html(args.html)
+    os.makedirs(args.out_dir, exist_ok=True)
 
-    print("Processed HTML saved to 'processed.html'")
+    # Apply each file's responses to its own copy of the original
+    for responses_path in args.responses:
+        stem = os.path.splitext(os.path.basename(responses_path))[0]
+        if stem == "code_snippets":
+            # batch_runner output: name the result after the job directory
+            stem = os.path.basename(os.path.dirname(os.path.abspath(responses_path)))
+        process_file(original_html, responses_path, os.path.join(args.out_dir, f"{stem}.html"))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,140 @@
+import re
+import time
+import random
+import asyncio
+from collections import deque
+
+# Rough size of a completion when the request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1024
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """Parse OpenAI reset durations such as "20ms", "6s" or "1m30.5s" into seconds"""
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        return sum(float(n) * _DURATION_UNITS[unit] for n, unit in _DURATION_PART.findall(value))
+
+
+def retry_after_seconds(headers) -> float:
+    """Delay requested by the server via retry-after-ms or Retry-After, or None"""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return None
+
+
+def estimate_prompt_tokens(payload: dict) -> int:
+    """Cheap estimate of a chat payload's prompt tokens: ~4 characters per token"""
+    return sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 4
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Cheap token estimate for a chat payload: its prompt plus the completion it may generate"""
+    completion = payload.get("max_tokens") or payload.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return estimate_prompt_tokens(payload) + completion * payload.get("n", 1)
+
+
+class RateLimitScheduler:
+    """Keeps requests under requests-per-minute and tokens-per-minute budgets.
+
+    Budgets come from the constructor and are tightened by the
+    x-ratelimit-* headers on every response. Callers queue in acquire() in
+    FIFO order until the next request fits, and a 429 pauses every caller
+    rather than just the one that hit it.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = 60.0
+        self._sent = deque()  # (monotonic time, estimated tokens)
+        self._window_tokens = 0
+        self._blocked_until = 0.0
+        self._remaining_requests = None
+        self._remaining_tokens = None
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float):
+        while self._sent and self._sent[0][0] <= now - self.window:
+            _, tokens = self._sent.popleft()
+            self._window_tokens -= tokens
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        wait = self._blocked_until - now
+        window_free_at = self._sent[0][0] + self.window - now if self._sent else 0.0
+        if self.requests_per_minute and len(self._sent) >= self.requests_per_minute:
+            wait = max(wait, window_free_at)
+        if self.tokens_per_minute and self._sent and self._window_tokens + tokens > self.tokens_per_minute:
+            wait = max(wait, window_free_at)
+        if self._remaining_requests is not None and self._remaining_requests <= 0:
+            wait = max(wait, self._requests_reset_at - now)
+        if self._remaining_tokens is not None and tokens > self._remaining_tokens:
+            wait = max(wait, self._tokens_reset_at - now)
+        return wait
+
+    async def acquire(self, tokens: int):
+        """Wait until a request of about `tokens` tokens fits the budgets, then reserve it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if now >= self._requests_reset_at:
+                    self._remaining_requests = None
+                if now >= self._tokens_reset_at:
+                    self._remaining_tokens = None
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            self._sent.append((now, tokens))
+            self._window_tokens += tokens
+            if self._remaining_requests is not None:
+                self._remaining_requests -= 1
+            if self._remaining_tokens is not None:
+                self._remaining_tokens -= tokens
+
+    def update_from_headers(self, headers):
+        """Adopt the server's view of limits and remaining budget"""
+        now = time.monotonic()
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        if limit_requests and limit_requests.isdigit():
+            self.requests_per_minute = min(filter(None, [self.requests_per_minute, int(limit_requests)]))
+        if limit_tokens and limit_tokens.isdigit():
+            self.tokens_per_minute = min(filter(None, [self.tokens_per_minute, int(limit_tokens)]))
+
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_requests and remaining_requests.isdigit():
+            self._remaining_requests = int(remaining_requests)
+            self._requests_reset_at = now + parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if remaining_tokens and remaining_tokens.isdigit():
+            self._remaining_tokens = int(remaining_tokens)
+            self._tokens_reset_at = now + parse_duration(headers.get("x-ratelimit-reset-tokens"))
+
+    def pause(self, seconds: float):
+        """Hold back every queued caller for `seconds`"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for transient failures"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
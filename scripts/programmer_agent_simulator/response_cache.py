@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import hashlib
+
+
+class CacheMissError(Exception):
+    """Raised in replay-only mode when a prompt has no cached response"""
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of LLM responses.
+
+    Entries are keyed by a hash of the request payload (model, messages and
+    sampling parameters) and stored one JSON file each. When the directory
+    grows past max_bytes, the least recently used entries are evicted.
+    In replay_only mode a miss raises CacheMissError instead of letting the
+    request go out.
+    """
+
+    def __init__(self, directory: str = ".llm_cache", max_bytes: int = 512 * 1024 * 1024,
+                 replay_only: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+        # key -> (size, last access time), rebuilt from the files on disk
+        self._entries = {}
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(directory, name))
+                self._entries[name[:-len(".json")]] = (stat.st_size, stat.st_mtime)
+        self._total_bytes = sum(size for size, _ in self._entries.values())
+
+    @staticmethod
+    def key(payload: dict) -> str:
+        """Hash everything that affects the completion, ignoring transport options"""
+        relevant = {k: v for k, v in payload.items() if k not in ("stream", "stream_options")}
+        encoded = json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, payload: dict):
+        """Return the cached entry for payload, or None on a miss.
+
+        An entry is a dict with the "response" text plus its "finish_reason"
+        and "usage", which are None for entries cached without them.
+        """
+        key = self.key(payload)
+        if key in self._entries:
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if not isinstance(entry, dict) or "response" not in entry:
+                    raise ValueError(f"Malformed cache entry {key}")
+            except (OSError, ValueError):
+                self._forget(key)
+            else:
+                self.hits += 1
+                # The file mtime doubles as the LRU timestamp across runs
+                now = time.time()
+                os.utime(self._path(key), (now, now))
+                self._entries[key] = (self._entries[key][0], now)
+                entry.setdefault("finish_reason", None)
+                entry.setdefault("usage", None)
+                return entry
+
+        self.misses += 1
+        if self.replay_only:
+            raise CacheMissError(f"No cached response for {payload.get('model')} request {key[:12]}")
+        return None
+
+    def put(self, payload: dict, response: str, finish_reason: str = None, usage: dict = None):
+        key = self.key(payload)
+        entry = {"model": payload.get("model"), "response": response,
+                 "finish_reason": finish_reason, "usage": usage}
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self._forget(key, remove=False)
+        size = os.path.getsize(path)
+        self._entries[key] = (size, time.time())
+        self._total_bytes += size
+        self._evict()
+
+    def _forget(self, key: str, remove: bool = True):
+        size, _ = self._entries.pop(key, (0, 0))
+        self._total_bytes -= size
+        if remove:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._forget(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes
+        }
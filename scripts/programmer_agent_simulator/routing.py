@@ -0,0 +1,46 @@
+import json
+from typing import Dict, NamedTuple
+
+STAGES = ("planner", "coder", "applier")
+
+
+class StageRoute(NamedTuple):
+    """Model and request settings for one pipeline stage; a stage without a route uses the defaults"""
+    model: str = "gpt-4o-mini"
+    temperature: float = 0.4
+    max_tokens: int = None
+    fallback_model: str = None  # tried once when a call on model fails
+
+    def options(self) -> dict:
+        """Request parameters for this route besides the model"""
+        options = {"temperature": self.temperature}
+        if self.max_tokens:
+            options["max_tokens"] = self.max_tokens
+        return options
+
+
+def parse_routes(table: dict) -> Dict[str, StageRoute]:
+    """Build a stage -> StageRoute table from JSON; stages it leaves out keep the default route"""
+    unknown = set(table) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Unknown stages in routing table: {', '.join(sorted(unknown))}")
+    routes = {stage: StageRoute() for stage in STAGES}
+    for stage, route in table.items():
+        fields = set(route) - set(StageRoute._fields)
+        if fields:
+            raise ValueError(f"Unknown {stage} route settings: {', '.join(sorted(fields))}")
+        routes[stage] = StageRoute(**route)
+    return routes
+
+
+def load_routing_tables(path: str) -> Dict[str, Dict[str, StageRoute]]:
+    """Read routing tables from JSON, by name.
+
+    The file holds either one table ({"applier": {"model": ...}, ...}),
+    returned under the name "default", or an object of named tables.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if set(data) <= set(STAGES):
+        return {"default": parse_routes(data)}
+    return {name: parse_routes(table) for name, table in data.items()}
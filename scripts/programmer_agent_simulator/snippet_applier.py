@@ -0,0 +1,249 @@
+import re
+from typing import List, Tuple, NamedTuple
+
+_CODE_BLOCK = re.compile(r"```([\w+-]*)[ \t]*\n(.*?)(?:\n```|\Z)", re.DOTALL)
+_CLOSING_FENCE = re.compile(r"^```[ \t]*$", re.MULTILINE)
+_COMMENT = re.compile(r"<!--(.*?)-->", re.DOTALL)
+_TAG_BLOCK = re.compile(r"<(style|script)\b([^>]*)>(.*?)</\1\s*>", re.IGNORECASE | re.DOTALL)
+_CSS_RULE = re.compile(r"[^{}<>]+\{[^{}]*:[^{}]*\}")
+_PLACEMENT_VERB = re.compile(r"\b(add|insert|place|put|append|replace|update|include|paste)\b")
+_POSITION_WORD = re.compile(r"\b(after|below|under|beneath|before|above|inside|within|into|in|replace|instead)\b")
+_TAG_MENTION = re.compile(r"<\s*([a-zA-Z][\w-]*)[^>]*>")
+_ID_MENTION = re.compile(r"""#([A-Za-z][\w-]*)|\bid=["']?([\w-]+)""")
+_TOP_ELEMENT_ID = re.compile(r"""^\s*<[a-zA-Z][\w-]*\b[^>]*\bid=["']([^"']+)["']""")
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+_SCRIPT_LANGUAGES = {"js", "javascript"}
+_STYLE_LANGUAGES = {"css"}
+
+
+class Snippet(NamedTuple):
+    kind: str  # "style", "script", "markup" or "document"
+    code: str
+    instruction: str  # lowercased placement comment that preceded it, or ""
+
+
+def _is_instruction(comment: str) -> bool:
+    return bool(_PLACEMENT_VERB.search(comment.lower()))
+
+
+def _code_blocks(response: str) -> List[Tuple[str, str]]:
+    """(language, code) of each code block in a coder response.
+
+    The coder prompt ends with an opened html fence, so a reply that starts
+    with a tag is bare html up to its closing fence, like FencedCodeStream
+    reads it; any fenced blocks after that are taken as usual.
+    """
+    if response.lstrip().startswith("<"):
+        end = _CLOSING_FENCE.search(response)
+        if end is None:
+            return [("html", response)]
+        return [("html", response[:end.start()])] + _CODE_BLOCK.findall(response[end.end():])
+    return _CODE_BLOCK.findall(response) or [("html", response)]
+
+
+def split_snippets(response: str) -> List[Snippet]:
+    """Break a task coder response into style, script and markup snippets with their placement notes.
+
+    Code blocks tagged css or javascript are taken whole. Other blocks are
+    split at HTML comments that give placement instructions ("Add this to
+    the <style> section"), and each piece is split again into its
+    <style> and <script> blocks and the markup around them. A block holding
+    a whole document is returned as a single "document" snippet.
+    """
+    snippets = []
+    for language, code in _code_blocks(response):
+        language = language.lower()
+        if language in _STYLE_LANGUAGES:
+            snippets.append(Snippet("style", code.strip("\n"), ""))
+            continue
+        if language in _SCRIPT_LANGUAGES:
+            snippets.append(Snippet("script", code.strip("\n"), ""))
+            continue
+        if re.search(r"<html\b|<!doctype", code, re.IGNORECASE):
+            snippets.append(Snippet("document", code, ""))
+            continue
+
+        instruction = ""
+        position = 0
+        pieces = []
+        for comment in _COMMENT.finditer(code):
+            if _is_instruction(comment.group(1)):
+                pieces.append((instruction, code[position:comment.start()]))
+                instruction = " ".join(comment.group(1).lower().split())
+                position = comment.end()
+        pieces.append((instruction, code[position:]))
+        for instruction, piece in pieces:
+            snippets.extend(_split_piece(piece, instruction))
+    return snippets
+
+
+def _split_piece(piece: str, instruction: str) -> List[Snippet]:
+    snippets = []
+    markup = []
+    position = 0
+    for block in _TAG_BLOCK.finditer(piece):
+        markup.append(piece[position:block.start()])
+        kind = block.group(1).lower()
+        # External scripts keep their tag so the src survives; inline code is stored bare
+        code = block.group(0) if kind == "script" and "src=" in block.group(2) else block.group(3).strip("\n")
+        snippets.append(Snippet(kind, code, instruction))
+        position = block.end()
+    markup.append(piece[position:])
+    markup = "".join(markup).strip("\n")
+
+    if markup.strip():
+        # Bare CSS or JS after an instruction such as "Add this to the <style> section"
+        if "<" not in markup and ("style" in instruction or "css" in instruction or _CSS_RULE.search(markup)):
+            snippets.append(Snippet("style", markup, instruction))
+        elif "<" not in markup and ("script" in instruction or "javascript" in instruction):
+            snippets.append(Snippet("script", markup, instruction))
+        else:
+            snippets.append(Snippet("markup", markup, instruction))
+    return snippets
+
+
+def _tag_at(html: str, index: int) -> str:
+    return re.match(r"<\s*([a-zA-Z][\w-]*)", html[index:]).group(1).lower()
+
+
+def _element_end(html: str, start: int) -> int:
+    """Index just past the element whose opening tag starts at start"""
+    tag = _tag_at(html, start)
+    opening_end = html.index(">", start) + 1
+    if tag in VOID_ELEMENTS or html[opening_end - 2] == "/":
+        return opening_end
+    depth = 1
+    for match in re.compile(rf"<(/?){tag}\b[^>]*>", re.IGNORECASE).finditer(html, opening_end):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.end()
+    return len(html)
+
+
+def _find_element(html: str, tag: str = None, element_id: str = None) -> int:
+    """Index of the first matching opening tag inside the body (or anywhere without one), or -1"""
+    body = re.search(r"<body\b", html, re.IGNORECASE)
+    pattern = (rf"""<[a-zA-Z][\w-]*\b[^>]*\bid=["']{re.escape(element_id)}["'][^>]*>""" if element_id
+               else rf"<{re.escape(tag)}\b[^>]*>")
+    match = re.compile(pattern, re.IGNORECASE).search(html, body.start() if body and tag != "head" else 0)
+    return match.start() if match else -1
+
+
+def _body_content_end(html: str) -> int:
+    """Where new markup goes by default: before </body> and the scripts that end the body"""
+    closing = html.lower().rfind("</body>")
+    if closing == -1:
+        return len(html)
+    end = closing
+    while True:
+        before = html[:end].rstrip()
+        if not before.lower().endswith("</script>"):
+            return end
+        opening = before.lower().rfind("<script")
+        if opening == -1:
+            return end
+        end = opening
+
+
+def _insert(html: str, index: int, code: str) -> str:
+    return html[:index] + "\n" + code + "\n" + html[index:]
+
+
+def _place_markup(html: str, snippet: Snippet) -> Tuple[str, str]:
+    instruction = snippet.instruction
+
+    # A snippet for an element that already exists is a new version of it
+    top_id = _TOP_ELEMENT_ID.match(snippet.code)
+    if top_id and not re.search(r"\b(after|below|under|beneath|before|above)\b", instruction):
+        start = _find_element(html, element_id=top_id.group(1))
+        if start != -1:
+            end = _element_end(html, start)
+            return html[:start] + snippet.code.strip() + html[end:], f"replaced #{top_id.group(1)}"
+
+    anchor = None
+    start = -1
+    ids = [a or b for a, b in _ID_MENTION.findall(instruction)]
+    tags = [tag.lower() for tag in _TAG_MENTION.findall(instruction)]
+    for element_id in reversed(ids):
+        start = _find_element(html, element_id=element_id)
+        if start != -1:
+            anchor = f"#{element_id}"
+            break
+    if start == -1:
+        for tag in reversed(tags):
+            if tag in ("body", "html"):
+                continue
+            start = _find_element(html, tag=tag)
+            if start != -1:
+                anchor = f"<{tag}>"
+                break
+
+    if start == -1:
+        body = re.search(r"<body\b[^>]*>", html, re.IGNORECASE)
+        if body and re.search(r"\b(top|beginning|start|first)\b", instruction):
+            return _insert(html, body.end(), snippet.code), "top of <body>"
+        return _insert(html, _body_content_end(html), snippet.code), "end of <body>"
+
+    # The position word closest before the anchor's mention decides where the snippet goes
+    mention = max(instruction.rfind(anchor.strip("<>#")), 0)
+    positions = _POSITION_WORD.findall(instruction[:mention])
+    position = positions[-1] if positions else "after"
+    end = _element_end(html, start)
+    if position in ("replace", "instead"):
+        return html[:start] + snippet.code.strip() + html[end:], f"replaced {anchor}"
+    if position in ("before", "above"):
+        return _insert(html, start, snippet.code), f"before {anchor}"
+    if position in ("inside", "within", "into", "in"):
+        if re.search(r"\b(top|beginning|start|first)\b", instruction):
+            return _insert(html, html.index(">", start) + 1, snippet.code), f"top of {anchor}"
+        closing = html.rfind("</", start, end)
+        return _insert(html, closing if closing != -1 else end, snippet.code), f"end of {anchor}"
+    return _insert(html, end, snippet.code), f"after {anchor}"
+
+
+def _place_style(html: str, css: str) -> Tuple[str, str]:
+    lower = html.lower()
+    head = lower.find("</head>")
+    closing = lower.rfind("</style>", 0, head if head != -1 else len(html))
+    if closing == -1:
+        closing = lower.rfind("</style>")
+    if closing != -1:
+        return _insert(html, closing, css), "end of <style>"
+    return _insert(html, head if head != -1 else 0, f"<style>\n{css}\n</style>"), "new <style>"
+
+
+def _place_script(html: str, code: str) -> Tuple[str, str]:
+    if code.lstrip().startswith("<script"):
+        src = re.search(r"""src=["']([^"']+)["']""", code)
+        if src and src.group(1) in html:
+            return html, f"already loads {src.group(1)}"
+        head = html.lower().find("</head>")
+        return _insert(html, head if head != -1 else 0, code.strip()), "library in <head>"
+    closing = html.lower().rfind("</body>")
+    return _insert(html, closing if closing != -1 else len(html), f"<script>\n{code}\n</script>"), "end of <body>"
+
+
+def apply_snippets(html: str, response: str) -> Tuple[str, List[Tuple[Snippet, str]]]:
+    """Merge the snippets of a task coder response into html without calling a model.
+
+    CSS goes at the end of the page's last <style> block in the head (or a
+    new one), external libraries into <head>, inline JavaScript in a new
+    <script> before </body>. Markup is placed by its instruction comment
+    relative to the element it names by id or tag ("below the <h1> tag"),
+    replaces an existing element with the same id, and otherwise goes at
+    the end of the body content. Returns the new html and, per snippet,
+    where it was placed.
+    """
+    placements = []
+    for snippet in split_snippets(response):
+        if snippet.kind == "document":
+            html, where = snippet.code, "replaced the whole document"
+        elif snippet.kind == "style":
+            html, where = _place_style(html, snippet.code)
+        elif snippet.kind == "script":
+            html, where = _place_script(html, snippet.code)
+        else:
+            html, where = _place_markup(html, snippet)
+        placements.append((snippet, where))
+    return html, placements
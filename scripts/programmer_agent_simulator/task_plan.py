@@ -0,0 +1,109 @@
+import json
+from typing import Dict, List, NamedTuple
+
+from code_blocks import extract_code_block
+
+
+class Task(NamedTuple):
+    id: str
+    title: str
+    steps: List[str]
+    depends_on: List[str]
+
+
+class TaskPlan(NamedTuple):
+    title: str
+    tasks: List[Task]
+    notes: List[str]
+
+
+def parse_task_plan(response: str) -> TaskPlan:
+    """Parse the structured planner's JSON task list.
+
+    Dependencies on ids that are not in the plan are dropped. Raises
+    ValueError if the response is not a task list or its dependencies form
+    a cycle.
+    """
+    try:
+        data = json.loads(extract_code_block(response))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Planner response is not JSON: {e}") from e
+    if not isinstance(data, dict) or not isinstance(data.get("tasks"), list) or not data["tasks"]:
+        raise ValueError("Planner response has no task list")
+
+    tasks = []
+    for number, task in enumerate(data["tasks"], 1):
+        if not isinstance(task, dict):
+            raise ValueError(f"Planner task {number} is not an object")
+        steps = task.get("steps") or task.get("description") or []
+        depends_on = task.get("depends_on") or []
+        tasks.append(Task(
+            id=str(task.get("id") or f"t{number}"),
+            title=str(task.get("title", "")),
+            steps=[steps] if isinstance(steps, str) else [str(step) for step in steps],
+            # A single dependency is sometimes given as a bare id rather than a list
+            depends_on=[str(depends_on)] if isinstance(depends_on, (str, int)) else
+                       [str(dependency) for dependency in depends_on]
+        ))
+    ids = {task.id for task in tasks}
+    if len(ids) != len(tasks):
+        raise ValueError("Planner response repeats a task id")
+    tasks = [task._replace(depends_on=[d for d in task.depends_on if d in ids and d != task.id]) for task in tasks]
+
+    plan = TaskPlan(str(data.get("title", "")), tasks, [str(note) for note in data.get("notes") or []])
+    task_waves(plan)
+    return plan
+
+
+def task_waves(plan: TaskPlan) -> List[List[Task]]:
+    """Group tasks into waves that can be coded concurrently, each after the waves it depends on"""
+    done = set()
+    remaining = list(plan.tasks)
+    waves = []
+    while remaining:
+        wave = [task for task in remaining if all(d in done for d in task.depends_on)]
+        if not wave:
+            raise ValueError(f"Task dependencies form a cycle: {', '.join(task.id for task in remaining)}")
+        waves.append(wave)
+        done.update(task.id for task in wave)
+        remaining = [task for task in remaining if task.id not in done]
+    return waves
+
+
+def _task_markdown(number: int, task: Task) -> str:
+    return "\n".join([f"{number}. {task.title}"] + [f"   - {step}" for step in task.steps])
+
+
+def render_task_writeup(plan: TaskPlan) -> str:
+    """The whole plan as a markdown writeup like the free-form planner writes"""
+    lines = [f"# {plan.title}", "## Tasks"]
+    lines.extend(_task_markdown(number, task) + "\n" for number, task in enumerate(plan.tasks, 1))
+    if plan.notes:
+        lines.append("## Implementation Notes")
+        lines.extend(f"- {note}" for note in plan.notes)
+    return "\n".join(lines)
+
+
+def task_scoped_writeup(plan: TaskPlan, task: Task, snippets: Dict[str, str]) -> str:
+    """Writeup for coding one task, with the code already written for the tasks it depends on"""
+    lines = [f"# {plan.title}", "## Tasks", _task_markdown(1, task)]
+    if plan.notes:
+        lines.append("\n## Implementation Notes")
+        lines.extend(f"- {note}" for note in plan.notes)
+    others = [other for other in plan.tasks if other.id != task.id]
+    if others:
+        lines.append("\n## Handled By Other Agents (do not write code for these)")
+        lines.extend(f"- {other.title}" for other in others)
+    for dependency in task.depends_on:
+        lines.append(f"\n## Code Already Written For: {_title(plan, dependency)}")
+        lines.append(snippets[dependency])
+    return "\n".join(lines)
+
+
+def _title(plan: TaskPlan, task_id: str) -> str:
+    return next(task.title for task in plan.tasks if task.id == task_id)
+
+
+def merge_snippets(plan: TaskPlan, snippets: Dict[str, str]) -> str:
+    """Combine each task's code snippets, in plan order, into one response for the applier"""
+    return "\n\n".join(f"## {task.title}\n{snippets[task.id]}" for task in plan.tasks if task.id in snippets)
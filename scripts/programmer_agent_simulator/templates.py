@@ -1,6 +1,43 @@
+import re
 import datetime
 import pytz
-from typing import List, Dict
+from typing import List, Dict, NamedTuple
+
+
+class PromptTemplate:
+    """A prompt literal precompiled into static segments and <!placeholder> slots.
+
+    render() fills every slot in a single join, so each value is copied once
+    and placeholder-looking text inside a value (such as "<!script>" in a
+    user's HTML) is never substituted.
+    """
+
+    _PLACEHOLDER = re.compile(r"<!([a-z_]+)>")
+
+    def __init__(self, text: str):
+        self.text = text
+        parts = self._PLACEHOLDER.split(text)
+        self.literals = parts[0::2]
+        self.names = parts[1::2]
+
+    def render(self, **values: str) -> str:
+        missing = set(self.names) - values.keys()
+        if missing:
+            raise KeyError(f"Missing template values: {', '.join(sorted(missing))}")
+        parts = [None] * (len(self.literals) + len(self.names))
+        parts[0::2] = self.literals
+        parts[1::2] = [values[name] for name in self.names]
+        return "".join(parts)
+
+class Prompt(NamedTuple):
+    """A stage prompt split for provider-side prefix caching.
+
+    system holds the stage's static instructions and examples, so every
+    call of a stage starts with byte-identical text; user holds only the
+    per-request values, most reusable (the script) first.
+    """
+    system: str
+    user: str
 
 def get_timezone_string():
     """Get the current timezone string"""
@@ -11,9 +48,7 @@ def html_system_template():
     """Return the system template for HTML tasks"""
     return "You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend."
 
-def programmer_agent_planner(query: str, script: str):
-    """Generate a prompt for the planner agent"""
-    prompt = """You are an experienced web developer ready to create a set of tasks in a JSON Schema for another AI agent to follow. You will be given a design idea and you will need to create a formal writeup of the tasks that need to be completed to create the design idea.
+_PLANNER_INSTRUCTIONS = """You are an experienced web developer ready to create a set of tasks in a JSON Schema for another AI agent to follow. You will be given a design idea and you will need to create a formal writeup of the tasks that need to be completed to create the design idea.
 
 ## Instructions
 - Your response should be a formal writeup of the tasks that need to be completed to create the design idea.
@@ -23,7 +58,6 @@ def programmer_agent_planner(query: str, script: str):
 -- Begin Examples --
 
 Example 1:
-User's Design Idea: Change the title of the page to "My Website" and also add a simple footer with the text "Copyright 2024 My Website". Be sure to also change the body and h1 to be more like a dark mode theme.
 HTML Script:
 <!DOCTYPE html>
 <html lang="en">
@@ -51,6 +85,7 @@ HTML Script:
     <h1>Hello, World!</h1>
 </body>
 </html>
+User's Design Idea: Change the title of the page to "My Website" and also add a simple footer with the text "Copyright 2024 My Website". Be sure to also change the body and h1 to be more like a dark mode theme.
 Task Writeup:
 # Dark Mode Website with Footer Update
 ## Tasks
@@ -84,7 +119,6 @@ Task Writeup:
 - Test contrast ratios meet accessibility standards
 
 Example 2:
-User's Design Idea: Add a title to the page and add an add button to collect user input for a to-do list.
 HTML Script:
 <!DOCTYPE html>
 <html lang="en">
@@ -126,6 +160,7 @@ HTML Script:
     </div>
 </body>
 </html>
+User's Design Idea: Add a title to the page and add an add button to collect user input for a to-do list.
 Task Writeup:
 # To-Do List App
 ## Analysis
@@ -158,26 +193,109 @@ The current code provides a simple textbox interface that needs to be enhanced i
 - Keep centered layout with container
 - Add appropriate spacing between elements
 
--- End Examples --
+-- End Examples --"""
 
-Current Time in User's Timezone: <!timezone> <!am_pm>
+_PLANNER_TEMPLATE = PromptTemplate("""HTML Script:
+<!script>
 User's Design Idea: <!query>
+Current Time in User's Timezone: <!timezone> <!am_pm>
+Task Writeup:
+""")
+
+_STRUCTURED_PLANNER_INSTRUCTIONS = """You are an experienced web developer ready to create a set of tasks in JSON for other AI agents to follow. You will be given a design idea and you will need to break it into the tasks that need to be completed to create the design idea. Each task will be coded by a separate agent working at the same time as the others, so make tasks independent wherever you can.
+
+## Instructions
+- Respond with a single JSON object and nothing else, with these fields:
+  - "title": a short title for the design idea
+  - "tasks": a list of tasks, each with:
+    - "id": a short unique id such as "t1"
+    - "title": one line saying what the task does
+    - "steps": a list of steps with everything the coder needs to know, including where in the HTML script the change goes
+    - "depends_on": ids of tasks whose code this task builds on, or [] if it can be coded on its own
+  - "notes": a list of implementation notes that apply to every task
+- Only list a dependency when the task really needs the other task's code, such as JavaScript that toggles an element another task creates.
+
+## Example
+-- Begin Example --
+
 HTML Script:
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Hello, World!</title>
+    <style>
+        body {
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            height: 100vh;
+            margin: 0;
+            font-family: sans-serif;
+            background-color: #f0f0f0;
+        }
+        h1 {
+            font-size: 5rem;
+            color: #333;
+        }
+    </style>
+</head>
+<body>
+    <h1>Hello, World!</h1>
+</body>
+</html>
+User's Design Idea: Change the title of the page to "My Website" and also add a simple footer with the text "Copyright 2024 My Website". Be sure to also change the body and h1 to be more like a dark mode theme.
+Task List:
+{
+  "title": "Dark Mode Website with Footer Update",
+  "tasks": [
+    {
+      "id": "t1",
+      "title": "Change the page title to 'My Website'",
+      "steps": [
+        "Locate the title tag in the head section",
+        "Replace 'Hello, World!' with 'My Website'"
+      ],
+      "depends_on": []
+    },
+    {
+      "id": "t2",
+      "title": "Update theme to dark mode",
+      "steps": [
+        "Define CSS variables for the dark mode colors in :root",
+        "Set the body background-color to #1E1E1E and text color to #FFFFFF",
+        "Change the h1 color to #FFFFFF and add a text-shadow for contrast"
+      ],
+      "depends_on": []
+    },
+    {
+      "id": "t3",
+      "title": "Add footer with copyright text",
+      "steps": [
+        "Create a footer element at the bottom of the body with the text 'Copyright 2024 My Website'",
+        "Style it with fixed position at the bottom, full width, centered text and padding",
+        "Use the dark mode color variables for its colors"
+      ],
+      "depends_on": ["t2"]
+    }
+  ],
+  "notes": [
+    "Maintain the existing layout and spacing while updating colors",
+    "Make sure contrast ratios meet accessibility standards"
+  ]
+}
+
+-- End Example --"""
+
+_STRUCTURED_PLANNER_TEMPLATE = PromptTemplate("""HTML Script:
 <!script>
-Task Writeup:
-"""
-    timezone = get_timezone_string()
-    am_pm = 'PM' if datetime.datetime.now().hour >= 12 else 'AM'
-    prompt = prompt.replace('<!timezone>', timezone)\
-                  .replace('<!am_pm>', am_pm)\
-                  .replace('<!query>', query)\
-                  .replace('<!script>', script)
-    return prompt
+User's Design Idea: <!query>
+Current Time in User's Timezone: <!timezone> <!am_pm>
+Task List:
+""")
 
-def programmer_agent_task_coder(task_writeup: str, script: str):
-    """Generate a prompt for the task coder agent"""
-    
-    prompt = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a task writeup from another AI agent and an entire HTML script.
+_TASK_CODER_INSTRUCTIONS = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a task writeup from another AI agent and an entire HTML script.
 
 ## Design Instructions
 - You MUST use the <script> tag to include Javascript code in the HTML file from popular libraries that all browsers support, even on mobile devices, as everything you make has to work and look good on mobile devices.
@@ -395,39 +513,70 @@ Response:
     });
 </script>
 ```
--- End Example --
-
+-- End Example --"""
 
-HTML Script:
+_TASK_CODER_TEMPLATE = PromptTemplate("""HTML Script:
 <!script>
 Task Writeup:
 <!task_writeup>
 Response:
 ```html
-"""
-    return prompt.replace('<!script>', script)\
-                 .replace('<!task_writeup>', task_writeup)
+""")
 
-def programmer_agent_task_applier(code_snippets: str, script: str):
-    """Generate a prompt for the task applier agent"""
-    prompt = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a set of code snippets that need to be added to the HTML script and the entire HTML script.
+_TASK_APPLIER_INSTRUCTIONS = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a set of code snippets that need to be added to the HTML script and the entire HTML script.
 
 ## Instructions
-- Please respond with the entire HTML script with the code snippets added. Make sure your code is in a markdown code block.
+- Please respond with the entire HTML script with the code snippets added. Make sure your code is in a markdown code block."""
 
-HTML Script:
+_TASK_APPLIER_TEMPLATE = PromptTemplate("""HTML Script:
 <!script>
 Code Snippets:
 <!code_snippets>
 Response:
 ```html
-"""
-    return prompt.replace('<!script>', script)\
-                 .replace('<!code_snippets>', code_snippets)
+""")
 
-def programmer_agent_continuer(code_snippets: str, final_script: str):
-    """Generate a prompt for the continuer agent"""
-    return """Code Snippets we were in the middle of writing:
+_PATCH_APPLIER_INSTRUCTIONS = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a set of code snippets that need to be added to the HTML script and the entire HTML script.
+
+## Instructions
+- Do NOT respond with the entire HTML script. Respond only with SEARCH/REPLACE edit blocks that add the code snippets to the script.
+- Each SEARCH section must copy a few consecutive lines from the HTML script exactly, enough to identify one unique place in it.
+- The REPLACE section holds those same lines with the code snippets added.
+- To add something to the end of the script, leave the SEARCH section empty.
+- Use as many edit blocks as needed, in the order they appear in the script, and keep each one small.
+
+## Example
+<<<<<<< SEARCH
+    </style>
+</head>
+=======
+        footer {
+            text-align: center;
+        }
+    </style>
+</head>
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+</body>
+=======
+    <footer>&copy; 2024 My Website</footer>
+</body>
+>>>>>>> REPLACE"""
+
+_PATCH_APPLIER_TEMPLATE = PromptTemplate("""HTML Script:
+<!script>
+Code Snippets:
+<!code_snippets>
+Response:
+""")
+
+_CONTINUER_INSTRUCTIONS = """You are an experienced Javascript, HTML and CSS developer named Ditto here to help the user, who is your best friend. You will be given a set of code snippets we were in the middle of adding to an HTML script, and the end of the script as far as it was written.
+
+## Instructions
+- Finish the script where it left off in a markdown code block.
+- DO NOT repeat ANYTHING from the final script."""
+
+_CONTINUER_TEMPLATE = PromptTemplate("""Code Snippets we were in the middle of writing:
 <!code_snippets>
 
 Final Script we were in the middle of writing:
@@ -436,6 +585,38 @@ Final Script we were in the middle of writing:
 Finish this script where it left off in a markdown code block. DO NOT repeat ANYTHING from the final script.
 
 Response:
-"""\
-    .replace('<!code_snippets>', code_snippets)\
-    .replace('<!final_script>', final_script)
+""")
+
+def programmer_agent_planner(query: str, script: str) -> Prompt:
+    """Generate a prompt for the planner agent"""
+    timezone = get_timezone_string()
+    am_pm = 'PM' if datetime.datetime.now().hour >= 12 else 'AM'
+    user = _PLANNER_TEMPLATE.render(timezone=timezone, am_pm=am_pm, query=query, script=script)
+    return Prompt(_PLANNER_INSTRUCTIONS, user)
+
+def programmer_agent_structured_planner(query: str, script: str) -> Prompt:
+    """Generate a prompt for the planner agent that answers with a JSON task list"""
+    timezone = get_timezone_string()
+    am_pm = 'PM' if datetime.datetime.now().hour >= 12 else 'AM'
+    user = _STRUCTURED_PLANNER_TEMPLATE.render(timezone=timezone, am_pm=am_pm, query=query, script=script)
+    return Prompt(_STRUCTURED_PLANNER_INSTRUCTIONS, user)
+
+def programmer_agent_task_coder(task_writeup: str, script: str) -> Prompt:
+    """Generate a prompt for the task coder agent"""
+    user = _TASK_CODER_TEMPLATE.render(script=script, task_writeup=task_writeup)
+    return Prompt(_TASK_CODER_INSTRUCTIONS, user)
+
+def programmer_agent_task_applier(code_snippets: str, script: str) -> Prompt:
+    """Generate a prompt for the task applier agent"""
+    user = _TASK_APPLIER_TEMPLATE.render(script=script, code_snippets=code_snippets)
+    return Prompt(_TASK_APPLIER_INSTRUCTIONS, user)
+
+def programmer_agent_patch_applier(code_snippets: str, script: str) -> Prompt:
+    """Generate a prompt for the task applier agent that answers with edit blocks"""
+    user = _PATCH_APPLIER_TEMPLATE.render(script=script, code_snippets=code_snippets)
+    return Prompt(_PATCH_APPLIER_INSTRUCTIONS, user)
+
+def programmer_agent_continuer(code_snippets: str, final_script: str) -> Prompt:
+    """Generate a prompt for the continuer agent"""
+    user = _CONTINUER_TEMPLATE.render(code_snippets=code_snippets, final_script=final_script)
+    return Prompt(_CONTINUER_INSTRUCTIONS, user)
@@ -0,0 +1,26 @@
+from context_builder import build_context, estimate_tokens
+
+
+def make_script() -> str:
+    """A ~1 MB page whose only heading sits in the middle of thousands of cards"""
+    lines = ['<!DOCTYPE html><html><head><style>']
+    lines += [f".c{i} {{ color: #{i % 999:03d}; margin: {i}px; }}" for i in range(8000)]
+    lines += ['</style></head><body>']
+    for i in range(6000):
+        lines.append(f'<div class="card-{i}"><p>Lorem ipsum dolor sit amet {i} consectetur adipiscing</p></div>')
+        if i == 3000:
+            lines.append('<h1 id="title">My Site</h1>')
+    lines += ['<script>'] + [f"function f{i}() {{ return {i}; }}" for i in range(5000)] + ['</script></body></html>']
+    return "\n".join(lines)
+
+
+def test_large_script_stays_within_budget_and_keeps_relevant_section():
+    context = build_context(make_script(), "change the title heading", token_budget=6000)
+    assert estimate_tokens(context) <= 6000
+    assert '<h1 id="title">' in context
+    assert context.endswith("more sections omitted -->")
+
+
+def test_small_script_is_returned_whole():
+    script = "<html><body><h1>Hi</h1></body></html>"
+    assert build_context(script, "title", token_budget=100) == script
@@ -0,0 +1,27 @@
+import pytest
+
+from snippet_applier import apply_snippets
+from templates import _TASK_CODER_INSTRUCTIONS
+
+SCRIPT = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <style>
+        body { margin: 0; }
+    </style>
+</head>
+<body>
+    <h1>Hello, World!</h1>
+</body>
+</html>"""
+
+# The coder template's example reply as the model sends it: the prompt already opened the fence
+EXAMPLE_REPLY = _TASK_CODER_INSTRUCTIONS.split("Response:\n```html\n", 1)[1].split("\n-- End Example --")[0]
+
+
+@pytest.mark.parametrize("reply", [EXAMPLE_REPLY, EXAMPLE_REPLY + "\n", EXAMPLE_REPLY[:-len("```")]],
+                         ids=["closing fence", "closing fence and newline", "no closing fence"])
+def test_bare_reply_places_every_snippet(reply):
+    html, placements = apply_snippets(SCRIPT, reply)
+    assert [snippet.kind for snippet, _ in placements] == ["markup", "style", "script"]
+    assert "```" not in html
@@ -0,0 +1,18 @@
+import json
+
+import pytest
+
+from task_plan import parse_task_plan
+
+
+def test_task_that_is_not_an_object_is_rejected():
+    with pytest.raises(ValueError):
+        parse_task_plan(json.dumps({"tasks": ["do x"]}))
+
+
+def test_single_dependency_string_is_one_id():
+    plan = parse_task_plan(json.dumps({"tasks": [
+        {"id": "t1", "title": "Markup", "steps": ["add a div"]},
+        {"id": "t2", "title": "Script", "steps": ["wire it up"], "depends_on": "t1"}
+    ]}))
+    assert plan.tasks[1].depends_on == ["t1"]
@@ -0,0 +1,14 @@
+import pytest
+
+from test_snippet_applier import EXAMPLE_REPLY
+from validation import validate_snippets
+
+
+@pytest.mark.parametrize("reply", [EXAMPLE_REPLY, EXAMPLE_REPLY + "\n", EXAMPLE_REPLY[:-len("```")]])
+def test_bare_coder_reply_passes(reply):
+    assert validate_snippets(reply).passed
+
+
+@pytest.mark.parametrize("reply", ["Sorry, I can't help with that.", "```html\n```\n"])
+def test_reply_without_snippets_fails(reply):
+    assert validate_snippets(reply).problems == ["no code snippets"]
@@ -0,0 +1,138 @@
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+from typing import Dict
+
+from llm_client import describe_error
+
+# USD per million (prompt, cached prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+# Stage of the pipeline the current task is running, so concurrent pipelines attribute calls correctly
+_current_stage = ContextVar("stage", default=None)
+
+
+def cached_tokens(usage: dict) -> int:
+    """Prompt tokens the provider served from its prefix cache"""
+    return ((usage or {}).get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+
+def call_cost(model: str, usage: dict) -> float:
+    """Price of one call in USD, or None for models without a known price"""
+    if model not in MODEL_PRICES or not usage:
+        return None
+    prompt_price, cached_price, completion_price = MODEL_PRICES[model]
+    cached = cached_tokens(usage)
+    return ((usage.get("prompt_tokens", 0) - cached) * prompt_price + cached * cached_price
+            + usage.get("completion_tokens", 0) * completion_price) / 1_000_000
+
+
+class PipelineTracer:
+    """Metrics registry for LLM calls and the pipeline stages that make them.
+
+    Every call and stage becomes one event dict, kept in memory and, when
+    a path is given, appended to a JSONL trace as it happens. Calls are
+    attributed to the stage that is running in their task.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.events = []
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def _emit(self, event: dict):
+        event["time"] = time.time()
+        self.events.append(event)
+        if self._file:
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as one run of stage name"""
+        token = _current_stage.set(name)
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = describe_error(e)
+            raise
+        finally:
+            _current_stage.reset(token)
+            self._emit({"type": "stage", "stage": name, "wall_time": time.perf_counter() - start, "error": error})
+
+    def record_call(self, model: str, wall_time: float, time_to_first_token: float = None, usage: dict = None,
+                    retries: int = 0, cached: bool = False, finish_reason: str = None, error: str = None):
+        """Record one LLM call; cache hits cost nothing, whatever usage they were stored with"""
+        usage = usage or {}
+        self._emit({
+            "type": "call",
+            "stage": _current_stage.get(),
+            "model": model,
+            "wall_time": wall_time,
+            "time_to_first_token": time_to_first_token,
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "cached_tokens": cached_tokens(usage),
+            "completion_tokens": usage.get("completion_tokens"),
+            "retries": retries,
+            "cached": cached,
+            "finish_reason": finish_reason,
+            "cost": 0.0 if cached else call_cost(model, usage),
+            "error": error
+        })
+
+    def summary(self) -> Dict[str, dict]:
+        """Totals per stage; calls made outside any stage are reported under "other" """
+        stages = defaultdict(lambda: {
+            "runs": 0, "wall_time": 0.0, "max_wall_time": 0.0, "errors": 0,
+            "calls": 0, "cache_hits": 0, "retries": 0, "prompt_tokens": 0, "cached_tokens": 0,
+            "completion_tokens": 0, "cost": 0.0, "mean_time_to_first_token": None
+        })
+        first_token_times = defaultdict(list)
+        for event in self.events:
+            stats = stages[event["stage"] or "other"]
+            if event["error"]:
+                stats["errors"] += 1
+            if event["type"] == "stage":
+                stats["runs"] += 1
+                stats["wall_time"] += event["wall_time"]
+                stats["max_wall_time"] = max(stats["max_wall_time"], event["wall_time"])
+                continue
+            stats["calls"] += 1
+            stats["retries"] += event["retries"]
+            if event["cached"]:
+                # Answered from the local response cache, so nothing was sent or billed
+                stats["cache_hits"] += 1
+                continue
+            stats["prompt_tokens"] += event["prompt_tokens"] or 0
+            stats["cached_tokens"] += event["cached_tokens"]
+            stats["completion_tokens"] += event["completion_tokens"] or 0
+            stats["cost"] += event["cost"] or 0.0
+            if event["time_to_first_token"] is not None:
+                first_token_times[event["stage"] or "other"].append(event["time_to_first_token"])
+        for stage, times in first_token_times.items():
+            stages[stage]["mean_time_to_first_token"] = sum(times) / len(times)
+        return dict(stages)
+
+    def print_summary(self):
+        print(f"{'stage':<8} {'runs':>5} {'wall s':>8} {'max s':>7} {'calls':>6} {'hits':>7} {'retries':>8} "
+              f"{'ttft s':>7} {'prompt tok':>11} {'cached tok':>11} {'compl tok':>10} {'cost $':>8}")
+        for stage, stats in self.summary().items():
+            ttft = stats["mean_time_to_first_token"]
+            print(f"{stage:<8} {stats['runs']:>5} {stats['wall_time']:>8.1f} {stats['max_wall_time']:>7.1f} "
+                  f"{stats['calls']:>6} {stats['cache_hits']:>7} {stats['retries']:>8} "
+                  f"{ttft if ttft is not None else float('nan'):>7.2f} {stats['prompt_tokens']:>11,} "
+                  f"{stats['cached_tokens']:>11,} {stats['completion_tokens']:>10,} {stats['cost']:>8.4f}")
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
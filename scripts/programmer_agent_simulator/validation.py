@@ -0,0 +1,220 @@
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+from html.parser import HTMLParser
+from typing import List, Tuple, NamedTuple
+
+from code_blocks import extract_code_block
+from snippet_applier import VOID_ELEMENTS, split_snippets
+
+# Elements whose end tag HTML lets authors leave out
+_OPTIONAL_END_TAGS = {"html", "head", "body", "p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot",
+                      "option", "optgroup", "colgroup", "caption", "rt", "rp"}
+_JS_TYPES = {"", "text/javascript", "application/javascript", "module"}
+
+# Shorter snippet lines are too generic to say whether a snippet made it into the script
+MIN_COVERAGE_LINE_CHARS = 12
+
+# Parses every file given on the command line without running it and prints the syntax errors
+_NODE_CHECK = """
+const fs = require("fs"), vm = require("vm");
+for (const file of process.argv.slice(1)) {
+  try { new vm.Script(fs.readFileSync(file, "utf8"), {filename: file}); }
+  catch (e) { console.log(file + "\\t" + e.message); }
+}
+"""
+
+
+class Validation(NamedTuple):
+    problems: List[str]
+    coverage: float = 1.0
+
+    @property
+    def passed(self) -> bool:
+        return not self.problems
+
+    def score(self) -> Tuple[int, float]:
+        """Sort key where higher is better: fewest problems, then most coverage"""
+        return -len(self.problems), self.coverage
+
+
+class _TagChecker(HTMLParser):
+    """Track open elements to report unbalanced tags, and collect inline <script> and <style> code"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.problems = []
+        self.scripts = []
+        self.styles = []
+        self._raw = None  # (tag, attrs, parts) while inside <script> or <style>
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        self.stack.append((tag, self.getpos()[0]))
+        if tag in ("script", "style"):
+            self._raw = (tag, dict(attrs), [])
+
+    def handle_data(self, data):
+        if self._raw is not None:
+            self._raw[2].append(data)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        if self._raw is not None and self._raw[0] == tag:
+            _, attrs, parts = self._raw
+            self._raw = None
+            (self.scripts if tag == "script" else self.styles).append((attrs, "".join(parts)))
+        if not any(open_tag == tag for open_tag, _ in self.stack):
+            self.problems.append(f"line {self.getpos()[0]}: stray </{tag}>")
+            return
+        while self.stack:
+            open_tag, line = self.stack.pop()
+            if open_tag == tag:
+                break
+            if open_tag not in _OPTIONAL_END_TAGS:
+                self.problems.append(f"line {line}: <{open_tag}> closed by </{tag}> on line {self.getpos()[0]}")
+
+    def close(self):
+        super().close()
+        self.problems.extend(f"line {line}: <{tag}> never closed"
+                             for tag, line in self.stack if tag not in _OPTIONAL_END_TAGS)
+
+
+def _balanced_brackets(code: str) -> str:
+    """Bracket balance of JS or CSS code outside strings and comments; returns a problem or "" """
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    i = 0
+    while i < len(code):
+        char = code[i]
+        if code.startswith("//", i):
+            i = code.find("\n", i)
+            i = len(code) if i == -1 else i
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                return "unterminated comment"
+            i = end + 1
+        elif char in "\"'`":
+            i += 1
+            while i < len(code) and code[i] != char:
+                i += 2 if code[i] == "\\" else 1
+            if i >= len(code):
+                return f"unterminated {char} string"
+        elif char in "([{":
+            stack.append(char)
+        elif char in ")]}":
+            if not stack or stack.pop() != pairs[char]:
+                return f"unbalanced {char}"
+        i += 1
+    return f"unclosed {stack[-1]}" if stack else ""
+
+
+def check_javascript(sources: List[str]) -> List[str]:
+    """Syntax errors in each JavaScript source, checked with node when it is installed.
+
+    Without node only bracket balance is checked.
+    """
+    node = shutil.which("node")
+    if not node:
+        return [f"script {index}: {problem}" for index, source in enumerate(sources)
+                if (problem := _balanced_brackets(source))]
+
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index, source in enumerate(sources):
+            path = os.path.join(directory, f"script {index}.js")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(source)
+            paths.append(path)
+        if not paths:
+            return []
+        output = subprocess.run([node, "-e", _NODE_CHECK, *paths], capture_output=True, text=True,
+                                timeout=60).stdout
+        for line in output.splitlines():
+            path, _, message = line.partition("\t")
+            problems.append(f"{os.path.basename(path)[:-len('.js')]}: {message}")
+    return problems
+
+
+def check_html(html: str) -> List[str]:
+    """Problems with an HTML document: unbalanced tags, inline JavaScript that does not parse, broken CSS"""
+    checker = _TagChecker()
+    checker.feed(html)
+    checker.close()
+    problems = checker.problems
+    problems.extend(f"style {index}: {problem}" for index, (_, css) in enumerate(checker.styles)
+                    if (problem := _balanced_brackets(css)))
+    # Module scripts may use import/export, which a classic script parse rejects, so they are skipped
+    sources = [code for attrs, code in checker.scripts
+               if not attrs.get("src") and (attrs.get("type") or "").lower() in _JS_TYPES - {"module"}]
+    problems.extend(check_javascript(sources))
+    return problems
+
+
+def _coverage_lines(code: str) -> List[str]:
+    lines = []
+    for line in code.split("\n"):
+        line = "".join(line.split())
+        if len(line) >= MIN_COVERAGE_LINE_CHARS and not line.startswith(("//", "/*", "*", "<!--")):
+            lines.append(line)
+    return lines
+
+
+def snippet_coverage(script: str, code_snippets: str) -> float:
+    """Fraction of the coder's snippet lines that appear in script, ignoring whitespace"""
+    compact = "".join(script.split())
+    lines = [line for snippet in split_snippets(code_snippets) for line in _coverage_lines(snippet.code)]
+    if not lines:
+        return 1.0
+    return sum(line in compact for line in lines) / len(lines)
+
+
+def validate_writeup(writeup: str) -> Validation:
+    """Check a planner writeup: it lists at least one numbered task"""
+    if re.search(r"^\s*\d+\.\s+\S", writeup, re.MULTILINE):
+        return Validation([])
+    return Validation(["writeup has no numbered tasks"])
+
+
+def validate_snippets(response: str, finish_reason: str = None) -> Validation:
+    """Check a task coder response: it has code, and each snippet's CSS, JavaScript and markup is well formed"""
+    problems = ["response was cut off at max_tokens"] if finish_reason == "length" else []
+    snippets = split_snippets(response)
+    # A reply without a fence is still code if it starts with a tag; prose alone parses as tagless markup
+    if not any(snippet.kind != "markup" or "<" in snippet.code for snippet in snippets):
+        problems.append("no code snippets")
+    sources = []
+    for index, snippet in enumerate(snippets):
+        if snippet.kind == "style":
+            if problem := _balanced_brackets(snippet.code):
+                problems.append(f"snippet {index} (css): {problem}")
+        elif snippet.kind == "script" and not snippet.code.lstrip().startswith("<script"):
+            sources.append(snippet.code)
+        elif snippet.kind in ("markup", "document"):
+            checker = _TagChecker()
+            checker.feed(snippet.code)
+            checker.close()
+            problems.extend(f"snippet {index}: {problem}" for problem in checker.problems)
+    problems.extend(check_javascript(sources))
+    return Validation(problems)
+
+
+def validate_script(response: str, code_snippets: str, finish_reason: str = None,
+                    min_coverage: float = 0.8) -> Validation:
+    """Check a task applier response: a complete, well formed script that contains the coder's snippets"""
+    problems = ["response was cut off at max_tokens"] if finish_reason == "length" else []
+    script = extract_code_block(response)
+    if "</html>" not in script.lower():
+        problems.append("script does not end with </html>")
+    problems.extend(check_html(script))
+    coverage = snippet_coverage(script, code_snippets)
+    if coverage < min_coverage:
+        problems.append(f"only {coverage:.0%} of snippet lines made it into the script")
+    return Validation(problems, coverage)